@@ -0,0 +1,47 @@
+#! /usr/bin/env python
+
+# pylint: disable=invalid-name,wrong-import-position
+"""
+Parses all the CoreNLP tagged tables in a directory once, and writes each of them next to the
+tagged file in the binary format read by ``table_io.read_from_binary_file``. The
+dataset reader and the search script use the binary files when they are at least as new as the
+tagged files.
+"""
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(os.path.join(__file__, os.pardir)))))
+
+from weak_supervision.semparse.contexts import TableQuestionContext, table_io
+
+
+def preprocess_tables(tables_directory: str, overwrite: bool) -> None:
+    num_written = 0
+    num_skipped = 0
+    for directory, _, filenames in os.walk(tables_directory):
+        for filename in sorted(filenames):
+            if not filename.endswith(".tagged"):
+                continue
+            table_filename = os.path.join(directory, filename)
+            if not overwrite and table_io.find_binary_table_file(table_filename):
+                num_skipped += 1
+                continue
+            try:
+                context = TableQuestionContext.read_from_file(table_filename, [])
+                table_io.write_table_to_binary_file(context, table_io.get_binary_table_filename(table_filename))
+                num_written += 1
+            except ValueError as error:
+                print(f"Skipping {table_filename}: {error}", file=sys.stderr)
+                num_skipped += 1
+    print(f"Wrote {num_written} binary tables, skipped {num_skipped}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("table_directory", type=str, help="Location of the 'tagged' directory in the"
+                        "WikiTableQuestions dataset")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Rewrite binary tables even if they are up to date")
+    args = parser.parse_args()
+    preprocess_tables(args.table_directory, args.overwrite)
@@ -5,7 +5,6 @@ import sys
 import os
 import argparse
 import gzip
-import logging
 import math
 from multiprocessing import Process
 
@@ -15,9 +14,10 @@ from allennlp.common.util import JsonDict
 from allennlp.data.tokenizers import WordTokenizer
 from allennlp.data.dataset_readers.semantic_parsing.wikitables import util as wikitables_util
 
-from weak_supervision.semparse.contexts import TableQuestionContext
+from weak_supervision.semparse.contexts import table_io
 from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld
 from weak_supervision.semparse import ActionSpaceWalker
+from weak_supervision.semparse.executors.util import get_diagnostic_counts
 
 def search(tables_directory: str,
            data: JsonDict,
@@ -28,38 +28,42 @@ def search(tables_directory: str,
            output_separate_files: bool,
            conservative_agenda: bool) -> None:
     print(f"Starting search with {len(data)} instances", file=sys.stderr)
-    executor_logger = logging.getLogger('weak_supervision.semparse.executors.wikitables_variable_free_executor')
-    executor_logger.setLevel(logging.ERROR)
     tokenizer = WordTokenizer()
     if output_separate_files and not os.path.exists(output_path):
         os.makedirs(output_path)
     if not output_separate_files:
         output_file_pointer = open(output_path, "w")
-    for instance_data in data:
-        utterance = instance_data["question"]
+
+    def get_examples():
+        for instance_data in data:
+            utterance = instance_data["question"]
+            if utterance.startswith('"') and utterance.endswith('"'):
+                utterance = utterance[1:-1]
+            # For example: csv/200-csv/47.csv -> tagged/200-tagged/47.tagged
+            table_file = instance_data["table_filename"].replace("csv", "tagged")
+            yield f"{tables_directory}/{table_file}", tokenizer.tokenize(utterance), (instance_data, utterance)
+
+    # Tables are read on a few threads, ahead of the search. Tables pre-parsed by
+    # ``preprocess_tables.py`` are read from their binary files, which is much faster.
+    for context, (instance_data, utterance) in table_io.read_from_files(get_examples()):
         question_id = instance_data["id"]
-        if utterance.startswith('"') and utterance.endswith('"'):
-            utterance = utterance[1:-1]
-        # For example: csv/200-csv/47.csv -> tagged/200-tagged/47.tagged
-        table_file = instance_data["table_filename"].replace("csv", "tagged")
         target_list = instance_data["target_values"]
-        tokenized_question = tokenizer.tokenize(utterance)
-        table_file = f"{tables_directory}/{table_file}"
-        context = TableQuestionContext.read_from_file(table_file, tokenized_question)
         world = WikiTablesVariableFreeWorld(context)
         walker = ActionSpaceWalker(world, max_path_length=max_path_length)
         correct_logical_forms = []
         if use_agenda:
             agenda = world.get_agenda(conservative=conservative_agenda)
             allow_partial_match = not conservative_agenda
-            all_logical_forms = walker.get_logical_forms_with_agenda(agenda=agenda,
-                                                                     max_num_logical_forms=10000,
-                                                                     allow_partial_match=allow_partial_match)
+            all_action_sequences = walker.get_action_sequences_with_agenda(agenda=agenda,
+                                                                           max_num_logical_forms=10000,
+                                                                           allow_partial_match=allow_partial_match)
         else:
-            all_logical_forms = walker.get_all_logical_forms(max_num_logical_forms=10000)
-        for logical_form in all_logical_forms:
-            if world.evaluate_logical_form(logical_form, target_list):
-                correct_logical_forms.append(logical_form)
+            all_action_sequences = walker.get_all_action_sequences(max_num_logical_forms=10000)
+        # We execute the action sequences directly, and only render the correct ones.
+        evaluations = world.evaluate_action_sequences(all_action_sequences, target_list)
+        for action_sequence, is_correct in zip(all_action_sequences, evaluations):
+            if is_correct:
+                correct_logical_forms.append(world.get_logical_form(action_sequence))
         if output_separate_files and correct_logical_forms:
             with gzip.open(f"{output_path}/{question_id}.gz", "wt") as output_file_pointer:
                 for logical_form in correct_logical_forms:
@@ -75,6 +79,8 @@ def search(tables_directory: str,
             print(file=output_file_pointer)
     if not output_separate_files:
         output_file_pointer.close()
+    for kind, count in sorted(get_diagnostic_counts().items()):
+        print(f"Executor diagnostics: {kind} happened {count} times", file=sys.stderr)
 
 
 
@@ -0,0 +1,39 @@
+# pylint: disable=no-self-use,invalid-name
+import pytest
+
+from allennlp.common.testing import AllenNlpTestCase
+
+from weak_supervision.common import LruCache
+
+
+class TestLruCache(AllenNlpTestCase):
+    def test_least_recently_used_item_is_evicted(self):
+        cache = LruCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        assert cache["a"] == 1
+        cache["c"] = 3
+        assert len(cache) == 2
+        assert "a" in cache and "c" in cache
+        assert "b" not in cache
+        assert cache.get("b") is None
+
+    def test_get_or_add_only_makes_missing_values(self):
+        cache = LruCache(2)
+        made_values = []
+
+        def make_value():
+            made_values.append(len(made_values))
+            return made_values[-1]
+
+        assert cache.get_or_add("a", make_value) == 0
+        assert cache.get_or_add("a", make_value) == 0
+        assert cache.get_or_add("b", make_value) == 1
+        assert made_values == [0, 1]
+        cache.discard("a")
+        cache.discard("a")
+        assert cache.get_or_add("a", make_value) == 2
+
+    def test_size_must_be_positive(self):
+        with pytest.raises(ValueError):
+            LruCache(0)
@@ -1,10 +1,16 @@
 # pylint: disable=no-self-use
+import os
+import shutil
+
+import pytest
 
 from allennlp.common import Params
+from allennlp.common.checks import ConfigurationError
 from allennlp.common.testing import AllenNlpTestCase
 
 from weak_supervision.data.dataset_readers import WikiTablesVariableFreeDatasetReader
-from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld
+from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld, LazyWikiTablesVariableFreeWorld
+from scripts.wikitables.preprocess_tables import preprocess_tables
 
 
 def assert_dataset_correct(dataset):
@@ -82,3 +88,50 @@ class WikiTablesVariableFreeDatasetReaderTest(AllenNlpTestCase):
         reader = WikiTablesVariableFreeDatasetReader.from_params(Params(params))
         dataset = reader.read("fixtures/data/wikitables/sample_data.examples")
         assert_dataset_correct(dataset)
+
+    def test_reader_reads_binary_tables(self):
+        tables_directory = os.path.join(self.TEST_DIR, "wikitables")
+        shutil.copytree("fixtures/data/wikitables/tables", os.path.join(tables_directory, "tables"))
+        preprocess_tables(tables_directory, overwrite=False)
+        assert os.path.exists(os.path.join(tables_directory, "tables", "590.tagged.bin"))
+        params = {
+                'lazy': False,
+                'tables_directory': tables_directory,
+                'offline_logical_forms_directory': "fixtures/data/wikitables/action_space_walker_output",
+                }
+        reader = WikiTablesVariableFreeDatasetReader.from_params(Params(params))
+        dataset = reader.read("fixtures/data/wikitables/sample_data.examples")
+        assert_dataset_correct(dataset)
+
+    def test_reader_reads_lazy_worlds(self):
+        params = {
+                'lazy': False,
+                'tables_directory': "fixtures/data/wikitables",
+                'offline_logical_forms_directory': "fixtures/data/wikitables/action_space_walker_output",
+                'lazy_worlds': True,
+                }
+        reader = WikiTablesVariableFreeDatasetReader.from_params(Params(params))
+        instances = list(reader.read("fixtures/data/wikitables/sample_data.examples"))
+        world = instances[0].fields['world'].as_tensor({})
+        assert isinstance(world, LazyWikiTablesVariableFreeWorld)
+        # The lazy world shares the knowledge graph of the table field.
+        table_graph = instances[0].fields['table'].knowledge_graph
+        assert world.table_context.get_table_knowledge_graph() is table_graph
+        actions = [action_field.rule for action_field in instances[0].fields['actions'].field_list]
+        assert world.all_possible_actions() == actions
+        assert isinstance(world.get_world(), WikiTablesVariableFreeWorld)
+        assert world.table_graph is table_graph
+
+    def test_text_to_instance_reads_table_lines(self):
+        reader = WikiTablesVariableFreeDatasetReader()
+        table_lines = [line.strip("\n").split("\t") for line in
+                       open("fixtures/data/wikitables/sample_table.tagged")]
+        instance = reader.text_to_instance("what was the last year?", table_lines, ["2004"])
+        world = instance.fields['world'].as_tensor({})
+        assert [token.text for token in world.table_context.question_tokens] == ["what", "was", "the",
+                                                                                 "last", "year", "?"]
+        with pytest.raises(ConfigurationError):
+            reader.text_to_instance("what was the last year?", target_values=["2004"])
+        with pytest.raises(ConfigurationError):
+            reader.text_to_instance("what was the last year?", table_lines, ["2004"],
+                                    table_context=world.table_context)
@@ -0,0 +1,59 @@
+# pylint: disable=no-self-use,invalid-name
+import os
+
+from allennlp.common.testing import AllenNlpTestCase
+from allennlp.data.tokenizers import WordTokenizer
+from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
+
+from weak_supervision.semparse.contexts import TableQuestionContext, table_io
+from weak_supervision.semparse.contexts.table_question_context import Date
+
+
+class TestTableIo(AllenNlpTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tokenizer = WordTokenizer(SpacyWordSplitter(pos_tags=True))
+
+    def test_read_from_files_keeps_the_order(self):
+        table_files = [f'{self.FIXTURES_ROOT}/data/corenlp_processed_tables/TEST-{index}.table'
+                       for index in [2, 8, 7, 2]]
+        questions = [self.tokenizer.tokenize(f"question {index}") for index in range(len(table_files))]
+        examples = [(table_file, question_tokens, index)
+                    for index, (table_file, question_tokens) in enumerate(zip(table_files, questions))]
+        contexts_and_indices = list(table_io.read_from_files(examples, num_threads=2, max_tables_ahead=2))
+        assert [index for _, index in contexts_and_indices] == list(range(len(table_files)))
+        contexts = [context for context, _ in contexts_and_indices]
+        # The two questions about TEST-2 share the table, which we only read once.
+        assert contexts[0].table_data is contexts[3].table_data
+        for table_file, question_tokens, context in zip(table_files, questions, contexts):
+            assert context == TableQuestionContext.read_from_file(table_file, question_tokens)
+            assert context.question_tokens == question_tokens
+        missing_files = table_files[:1] + [os.path.join(self.TEST_DIR, "missing.table")]
+        contexts = table_io.read_from_files((table_file, [], None) for table_file in missing_files)
+        assert next(contexts)[0].question_tokens == []
+        with self.assertRaises(FileNotFoundError):
+            next(contexts)
+
+    def test_binary_table_file_round_trip(self):
+        question_tokens = self.tokenizer.tokenize("what was the attendance?")
+        test_file = f'{self.FIXTURES_ROOT}/data/corenlp_processed_tables/TEST-8.table'
+        assert table_io.find_binary_table_file(test_file) is None
+        context = TableQuestionContext.read_from_file(test_file, question_tokens)
+        binary_file = os.path.join(self.TEST_DIR, "TEST-8.table.bin")
+        table_io.write_table_to_binary_file(context, binary_file)
+        binary_context = table_io.read_from_file(binary_file, question_tokens)
+        assert binary_context.table_id == context.table_id
+        assert binary_context.column_types == context.column_types
+        assert binary_context.question_tokens == question_tokens
+        # Dates with unknown fields are equal to more specific dates, so we compare strings too.
+        assert binary_context.table_data == context.table_data
+        for binary_row, row in zip(binary_context.table_data, context.table_data):
+            assert list(binary_row.keys()) == list(row.keys())
+            assert [str(value) for value in binary_row.values()] == [str(value) for value in row.values()]
+        assert binary_context.get_entities_from_question() == context.get_entities_from_question()
+
+    def test_write_table_to_binary_file_rejects_dates_out_of_range(self):
+        table_data = [{"date_column:date": Date(2 ** 70, 1, 1)}]
+        context = TableQuestionContext(table_data, {"date": {"date"}}, [])
+        with self.assertRaises(ValueError):
+            table_io.write_table_to_binary_file(context, os.path.join(self.TEST_DIR, "dates.table.bin"))
@@ -1,8 +1,11 @@
 # pylint: disable=no-self-use
 # pylint: disable=invalid-name
+# pylint: disable=too-many-public-methods
+import os
+import pickle
 
 from allennlp.common.testing import AllenNlpTestCase
-from allennlp.data.tokenizers import WordTokenizer
+from allennlp.data.tokenizers import Token, WordTokenizer
 from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
 
 from weak_supervision.semparse.contexts import TableQuestionContext
@@ -226,3 +229,144 @@ class TestTableQuestionContext(AllenNlpTestCase):
                                           'number_column:regular_season', 'number_column:year',
                                           'number_column:open_cup'}
         assert neighbors['-1'] == ['date_column:year']
+
+    def test_table_id_identifies_table(self):
+        question_tokens = self.tokenizer.tokenize("what was the attendance?")
+        test_file = f'{self.FIXTURES_ROOT}/data/wikitables/sample_table.tagged'
+        context_from_file = TableQuestionContext.read_from_file(test_file, question_tokens)
+        assert context_from_file.table_id.startswith(os.path.abspath(test_file))
+        table_file = TableQuestionContext.get_table_file_from_id(context_from_file.table_id)
+        assert table_file == os.path.abspath(test_file)
+        lines = [line.strip("\n").split("\t") for line in open(test_file).readlines()]
+        # Tables read from lines are only identified by their content when we ask for it.
+        assert TableQuestionContext.read_from_lines(lines, question_tokens).table_id is None
+        context_from_lines = TableQuestionContext.read_from_lines(lines, question_tokens, identify_by_content=True)
+        other_context_from_lines = TableQuestionContext.read_from_lines(lines, [], identify_by_content=True)
+        assert context_from_lines.table_id == other_context_from_lines.table_id
+        assert TableQuestionContext.get_table_file_from_id(context_from_lines.table_id) is None
+        other_table = f'{self.FIXTURES_ROOT}/data/corenlp_processed_tables/TEST-2.table'
+        other_lines = [line.strip("\n").split("\t") for line in open(other_table).readlines()]
+        other_table_id = TableQuestionContext.read_from_lines(other_lines, [], identify_by_content=True).table_id
+        assert other_table_id != context_from_lines.table_id
+
+    def test_read_from_lines_accepts_an_iterator(self):
+        test_file = f'{self.FIXTURES_ROOT}/data/wikitables/sample_table.tagged'
+        lines = [line.strip("\n").split("\t") for line in open(test_file).readlines()]
+        context = TableQuestionContext.read_from_lines(lines, [], identify_by_content=True)
+        streamed_context = TableQuestionContext.read_from_lines(iter(lines), [], identify_by_content=True)
+        assert streamed_context.table_id == context.table_id == TableQuestionContext.get_table_id_from_lines(lines)
+        assert streamed_context.table_data == context.table_data
+        assert streamed_context.column_types == context.column_types
+
+    def test_column_names_and_cell_strings_are_shared_across_tables(self):
+        test_file = f'{self.FIXTURES_ROOT}/data/wikitables/sample_table.tagged'
+        lines = [line.strip("\n").split("\t") for line in open(test_file).readlines()]
+        context = TableQuestionContext.read_from_lines(lines, [], "first_table")
+        other_context = TableQuestionContext.read_from_lines(lines, [], "second_table")
+        for row, other_row in zip(context.table_data, other_context.table_data):
+            for (column_name, value), (other_column_name, other_value) in zip(row.items(), other_row.items()):
+                assert column_name is other_column_name
+                if isinstance(value, str):
+                    assert value is other_value
+
+    def test_compact_table_data_reads_like_dicts(self):
+        test_file = f'{self.FIXTURES_ROOT}/data/wikitables/sample_table.tagged'
+        context = TableQuestionContext.read_from_file(test_file, [])
+        table_data = context.table_data
+        compact_context = TableQuestionContext.read_from_file(test_file, []).compact_table_data()
+        assert not isinstance(compact_context.table_data[0], dict)
+        assert compact_context.table_data == table_data
+        for compact_row, row in zip(compact_context.table_data, table_data):
+            assert list(compact_row.items()) == list(row.items())
+            assert compact_row['string_column:league'] == row['string_column:league']
+            assert 'string_column:nation' not in compact_row
+        # All the rows in the table have the same columns, so they share one schema.
+        first_row, second_row = compact_context.table_data
+        assert first_row._column_indices is second_row._column_indices  # pylint: disable=protected-access
+        assert pickle.loads(pickle.dumps(compact_context.table_data)) == table_data
+
+    def test_with_question_matches_reading_the_table_again(self):
+        test_file = f'{self.FIXTURES_ROOT}/data/corenlp_processed_tables/TEST-7.table'
+        first_question = self.tokenizer.tokenize("how many players had more than 100 points scored?")
+        second_question = self.tokenizer.tokenize("who scored the most points in 1916?")
+        context = TableQuestionContext.read_from_file(test_file, first_question)
+        first_graph = context.get_table_knowledge_graph()
+        new_context = context.with_question(second_question)
+        expected_context = TableQuestionContext.read_from_file(test_file, second_question)
+        assert new_context.table_data is context.table_data
+        assert new_context.question_tokens == second_question
+        assert new_context.get_entities_from_question() == expected_context.get_entities_from_question()
+        new_graph = new_context.get_table_knowledge_graph()
+        assert new_graph.entities == expected_context.get_table_knowledge_graph().entities
+        assert context.get_table_knowledge_graph() is first_graph
+        assert context.question_tokens == first_question
+        # Entities found before, like the ones pickled with a world, are not looked for again.
+        entities_and_numbers = expected_context.get_entities_from_question()
+        context_with_entities = context.with_question(second_question, entities_and_numbers, new_graph)
+        assert context_with_entities.get_entities_from_question() is entities_and_numbers
+        assert context_with_entities.get_table_knowledge_graph() is new_graph
+
+    def test_question_entities_are_found_in_cells_and_substrings_of_cells(self):
+        table_data = [{"string_column:league": "usl_a_league", "string_column:playoffs": "quarterfinals"},
+                      {"string_column:league": "a_league", "string_column:playoffs": "a_league_cup"}]
+        column_types = {"league": {"string"}, "playoffs": {"string"}}
+
+        def get_string_entities(question_token: str):
+            context = TableQuestionContext(table_data, column_types, [Token(question_token)])
+            return [(entity, set(column_names)) for entity, column_names in
+                    context.get_entities_from_question()[0]]
+        # Exact matches take precedence over substrings.
+        assert get_string_entities("a_league") == [("string:a_league", {"string_column:league"})]
+        assert get_string_entities("league") == [("string:league", {"string_column:league",
+                                                                    "string_column:playoffs"})]
+        assert get_string_entities("final") == [("string:final", {"string_column:playoffs"})]
+        # Substrings should not span cells.
+        assert get_string_entities("league_a") == []
+
+    def test_normalize_string(self):
+        assert TableQuestionContext.normalize_string("“Ðøng” – Café…") == "_d_ng_cafe"
+        assert TableQuestionContext.normalize_string(" Ŧest\\nline ²³ ") == "test_line"
+        assert TableQuestionContext.normalize_string("a__b  c!!") == "a_b_c"
+        assert TableQuestionContext.normalize_string("  x – ") == "x"
+
+    def test_question_token_tags(self):
+        question_tokens = self.tokenizer.tokenize("which team won two thousand games in july 1950s or 00s?")
+        test_file = f'{self.FIXTURES_ROOT}/data/corenlp_processed_tables/TEST-7.table'
+        table_question_context = TableQuestionContext.read_from_file(test_file, question_tokens)
+        token_tags = table_question_context.get_question_token_tags()
+        assert [tags.is_month for tags in token_tags].index(True) == 7
+        assert token_tags[4].magnitude == 1000
+        assert token_tags[8].range_size == 10
+        assert table_question_context.get_question_token_tags() is token_tags
+        _, number_entities = table_question_context.get_entities_from_question()
+        assert number_entities == [("2000", 3), ("7", 7), ("1950", 8), ("1960", 8), ("0", 10), ("100", 10)]
+
+    def test_knowledge_graphs_of_questions_on_the_same_table_do_not_interfere(self):
+        test_file = f'{self.FIXTURES_ROOT}/data/wikitables/sample_table.tagged'
+        question_tokens = self.tokenizer.tokenize("when was the attendance greater than 5000?")
+        context = TableQuestionContext.read_from_file(test_file, question_tokens)
+        neighbors = context.get_table_knowledge_graph().neighbors
+        assert neighbors['number_column:avg_attendance'] == ['5000']
+        other_question_tokens = self.tokenizer.tokenize("what was the attendance?")
+        other_context = TableQuestionContext.read_from_file(test_file, other_question_tokens)
+        other_graph = other_context.get_table_knowledge_graph()
+        assert other_graph.neighbors['number_column:avg_attendance'] == []
+        assert '5000' not in other_graph.entities
+        assert other_graph.neighbors['-1'] == ['date_column:year']
+        assert neighbors['-1'] == ['date_column:year']
+        assert other_graph.entity_text['number_column:avg_attendance'] == 'avg attendance'
+
+    def test_knowledge_graphs_made_with_question_share_the_columns(self):
+        test_file = f'{self.FIXTURES_ROOT}/data/wikitables/sample_table.tagged'
+        context = TableQuestionContext.read_from_file(test_file, [])
+        graph = context.get_table_knowledge_graph()
+        question_tokens = self.tokenizer.tokenize("when was the attendance greater than 5000?")
+        question_graph = context.with_question(question_tokens).get_table_knowledge_graph()
+        assert question_graph.neighbors['number_column:avg_attendance'] == ['5000']
+        assert question_graph.neighbors['string_column:league'] is graph.neighbors['string_column:league']
+        assert graph.neighbors['number_column:avg_attendance'] == []
+        assert '5000' not in graph.entities and '5000' not in graph.entity_text
+        expected_context = TableQuestionContext.read_from_file(test_file, question_tokens)
+        expected_graph = expected_context.get_table_knowledge_graph()
+        assert question_graph.entities == expected_graph.entities
+        assert question_graph.entity_text == expected_graph.entity_text
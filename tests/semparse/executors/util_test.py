@@ -0,0 +1,54 @@
+# pylint: disable=no-self-use,invalid-name
+from allennlp.common.testing import AllenNlpTestCase
+
+from weak_supervision.semparse.executors import WikiTablesVariableFreeExecutor
+from weak_supervision.semparse.executors.util import (clear_executor_cache, get_diagnostic_counts,
+                                                      get_executor_for_table, log_diagnostic_counts,
+                                                      parse_logical_form, parse_shared_logical_form,
+                                                      share_expression)
+
+
+class TestExecutorUtil(AllenNlpTestCase):
+    def setUp(self):
+        super().setUp()
+        self.table_data = [{"string_column:league": "usl_a_league", "number_column:year": 2001.0},
+                           {"string_column:league": "usl_first_division", "number_column:year": 2005.0}]
+
+    def test_log_diagnostic_counts(self):
+        get_diagnostic_counts(reset=True)
+        WikiTablesVariableFreeExecutor(self.table_data).execute("(first (filter_number_greater all_rows "
+                                                                "number_column:year 2010))")
+        with self.assertLogs("weak_supervision.semparse.executors", level="INFO") as logs:
+            log_diagnostic_counts(reset=True)
+        assert len(logs.output) == 1
+        assert "first_of_empty_list happened 1 times" in logs.output[0]
+        assert get_diagnostic_counts() == {}
+
+    def test_parse_shared_logical_form_shares_equal_sub_expressions(self):
+        unique_expressions = {}
+        expression = parse_shared_logical_form("(count (filter_in (first all_rows) string_column:league "
+                                               "(select_string (first all_rows) string_column:league)))",
+                                               unique_expressions)
+        assert expression[0] == "count"
+        filter_expression = expression[1]
+        assert filter_expression[1] == ("first", "all_rows")
+        assert filter_expression[1] is filter_expression[3][1]
+        other_expression = share_expression(["count", ["first", "all_rows"]], unique_expressions)
+        assert other_expression[1] is filter_expression[1]
+
+    def test_parse_logical_form_makes_nested_lists(self):
+        logical_form = "(select (filter_in all_rows string_column:league usl_a_league) number_column:year)"
+        expected_expression = ["select", ["filter_in", "all_rows", "string_column:league", "usl_a_league"],
+                               "number_column:year"]
+        assert parse_logical_form(logical_form) == expected_expression
+        assert parse_logical_form(logical_form[1:-1]) == expected_expression
+        assert share_expression(expected_expression, {}) == parse_shared_logical_form(logical_form, {})
+
+    def test_get_executor_for_table_shares_executors_per_table(self):
+        clear_executor_cache()
+        executor = get_executor_for_table("table_1", lambda: WikiTablesVariableFreeExecutor(self.table_data))
+        assert get_executor_for_table("table_1", lambda: WikiTablesVariableFreeExecutor([])) is executor
+        assert get_executor_for_table("table_2", lambda: WikiTablesVariableFreeExecutor([])) is not executor
+        assert get_executor_for_table(None, lambda: WikiTablesVariableFreeExecutor([])) is not executor
+        clear_executor_cache()
+        assert get_executor_for_table("table_1", lambda: WikiTablesVariableFreeExecutor([])) is not executor
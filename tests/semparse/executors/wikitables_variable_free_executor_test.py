@@ -1,10 +1,15 @@
 # pylint: disable=no-self-use,invalid-name,too-many-public-methods
+import pickle
+
+import pytest
+
 from allennlp.common.testing import AllenNlpTestCase
 from allennlp.data.tokenizers import WordTokenizer
 from allennlp.semparse.worlds.world import ExecutionError
 
 from weak_supervision.semparse.contexts import TableQuestionContext
 from weak_supervision.semparse.executors import WikiTablesVariableFreeExecutor
+from weak_supervision.semparse.executors.util import get_diagnostic_counts
 from weak_supervision.semparse.executors.wikitables_variable_free_executor import Date
 
 
@@ -242,17 +247,14 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         cell_list = self.executor.execute(logical_form)
         assert cell_list == ["4th_western"]
 
-    def test_execute_logs_warning_with_first_on_empty_list(self):
+    def test_execute_counts_first_on_empty_list(self):
         # Selecting "regular season" from the first row where year is greater than 2010.
-        with self.assertLogs("weak_supervision.semparse.executors.wikitables_variable_free_executor") as log:
-            logical_form = """(select_string (first (filter_date_greater all_rows date_column:date
-                                                (date 2010 -1 -1)))
-                                      string_column:regular_season)"""
-            self.executor.execute(logical_form)
-        self.assertEqual(log.output,
-                         ["WARNING:weak_supervision.semparse.executors.wikitables_variable_free_executor:"
-                          "Trying to get first row from an empty list: "
-                          "['filter_date_greater', 'all_rows', 'date_column:date', ['date', '2010', '-1', '-1']]"])
+        get_diagnostic_counts(reset=True)
+        logical_form = """(select_string (first (filter_date_greater all_rows date_column:date
+                                            (date 2010 -1 -1)))
+                                  string_column:regular_season)"""
+        self.executor.execute(logical_form)
+        assert get_diagnostic_counts() == {"first_of_empty_list": 1}
 
     def test_execute_works_with_last(self):
         # Selecting "regular season" from the last row where year is not equal to 2010.
@@ -262,17 +264,14 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         cell_list = self.executor.execute(logical_form)
         assert cell_list == ["5th"]
 
-    def test_execute_logs_warning_with_last_on_empty_list(self):
+    def test_execute_counts_last_on_empty_list(self):
         # Selecting "regular season" from the last row where year is greater than 2010.
-        with self.assertLogs("weak_supervision.semparse.executors.wikitables_variable_free_executor") as log:
-            logical_form = """(select_string (last (filter_date_greater all_rows date_column:date
-                                                (date 2010 -1 -1)))
-                                      string_column:regular_season)"""
-            self.executor.execute(logical_form)
-        self.assertEqual(log.output,
-                         ["WARNING:weak_supervision.semparse.executors.wikitables_variable_free_executor:"
-                          "Trying to get last row from an empty list: "
-                          "['filter_date_greater', 'all_rows', 'date_column:date', ['date', '2010', '-1', '-1']]"])
+        get_diagnostic_counts(reset=True)
+        logical_form = """(select_string (last (filter_date_greater all_rows date_column:date
+                                            (date 2010 -1 -1)))
+                                  string_column:regular_season)"""
+        self.executor.execute(logical_form)
+        assert get_diagnostic_counts() == {"last_of_empty_list": 1}
 
     def test_execute_works_with_previous(self):
         # Selecting "regular season" from the row before last where year is not equal to 2010.
@@ -282,17 +281,14 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         cell_list = self.executor.execute(logical_form)
         assert cell_list == ["4th_western"]
 
-    def test_execute_logs_warning_with_previous_on_empty_list(self):
+    def test_execute_counts_previous_on_empty_list(self):
         # Selecting "regular season" from the row before the one where year is greater than 2010.
-        with self.assertLogs("weak_supervision.semparse.executors.wikitables_variable_free_executor") as log:
-            logical_form = """(select_string (previous (filter_date_greater all_rows date_column:date
-                                                         (date 2010 -1 -1)))
-                                      string_column:regular_season)"""
-            self.executor.execute(logical_form)
-        self.assertEqual(log.output,
-                         ["WARNING:weak_supervision.semparse.executors.wikitables_variable_free_executor:"
-                          "Trying to get the previous row from an empty list: "
-                          "['filter_date_greater', 'all_rows', 'date_column:date', ['date', '2010', '-1', '-1']]"])
+        get_diagnostic_counts(reset=True)
+        logical_form = """(select_string (previous (filter_date_greater all_rows date_column:date
+                                                     (date 2010 -1 -1)))
+                                  string_column:regular_season)"""
+        self.executor.execute(logical_form)
+        assert get_diagnostic_counts() == {"previous_of_empty_list": 1}
 
     def test_execute_works_with_next(self):
         # Selecting "regular season" from the row after first where year is not equal to 2010.
@@ -302,17 +298,14 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         cell_list = self.executor.execute(logical_form)
         assert cell_list == ["5th"]
 
-    def test_execute_logs_warning_with_next_on_empty_list(self):
+    def test_execute_counts_next_on_empty_list(self):
         # Selecting "regular season" from the row after the one where year is greater than 2010.
-        with self.assertLogs("weak_supervision.semparse.executors.wikitables_variable_free_executor") as log:
-            logical_form = """(select_string (next (filter_date_greater all_rows date_column:date
-                                                    (date 2010 -1 -1)))
-                                      string_column:regular_season)"""
-            self.executor.execute(logical_form)
-        self.assertEqual(log.output,
-                         ["WARNING:weak_supervision.semparse.executors.wikitables_variable_free_executor:"
-                          "Trying to get the next row from an empty list: "
-                          "['filter_date_greater', 'all_rows', 'date_column:date', ['date', '2010', '-1', '-1']]"])
+        get_diagnostic_counts(reset=True)
+        logical_form = """(select_string (next (filter_date_greater all_rows date_column:date
+                                                (date 2010 -1 -1)))
+                                  string_column:regular_season)"""
+        self.executor.execute(logical_form)
+        assert get_diagnostic_counts() == {"next_of_empty_list": 1}
 
     def test_execute_works_with_max_date(self):
         logical_form = """(max_date all_rows date_column:date)"""
@@ -350,6 +343,28 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         cell_list = self.executor.execute(logical_form)
         assert cell_list == ["usl_a_league", "usl_first_division"]
 
+    def test_previous_and_next_tell_equal_rows_apart(self):
+        # The first two rows are equal, so previous and next have to find rows by identity to
+        # return the neighbors of the right one.
+        table_data = [{"string_column:league": "usl_a_league", "number_column:year": 2001.0},
+                      {"string_column:league": "usl_a_league", "number_column:year": 2001.0},
+                      {"string_column:league": "usl_first_division", "number_column:year": 2005.0}]
+        executor = WikiTablesVariableFreeExecutor(table_data)
+        rows = executor.execute("(previous (last (filter_number_equals all_rows number_column:year 2001)))")
+        assert len(rows) == 1 and rows[0] is table_data[0]
+        rows = executor.execute("(next (first (filter_number_equals all_rows number_column:year 2001)))")
+        assert len(rows) == 1 and rows[0] is table_data[1]
+        rows = executor.execute("(next (filter_number_equals all_rows number_column:year 2001))")
+        assert len(rows) == 1 and rows[0] is table_data[2]
+        rows = self.executor.same_as(["all_rows"], "date_column:date")
+        assert rows == [self.executor.table_data[0]]
+
+    def test_same_as_does_not_match_nan_values(self):
+        table_data = [{"number_column:attendance": float("nan")},
+                      {"number_column:attendance": float("nan")}]
+        executor = WikiTablesVariableFreeExecutor(table_data)
+        assert executor.same_as(["all_rows"], "number_column:attendance") == []
+
     def test_execute_works_with_sum(self):
         # Get total "avg attendance".
         logical_form = """(sum all_rows number_column:avg_attendance)"""
@@ -388,6 +403,19 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         with self.assertRaises(ExecutionError):
             self.executor.execute(logical_form)
 
+    def test_execute_does_not_evaluate_siblings_of_empty_row_lists(self):
+        # The second argument would fail if it were executed.
+        logical_form = """(diff (filter_number_greater all_rows number_column:avg_attendance 10000)
+                                (unknown_function all_rows) number_column:division)"""
+        assert self.executor.execute(logical_form) == 0.0
+        table_data = [{"number_column:attendance": None, "date_column:date": None,
+                       "string_column:league": None}]
+        executor = WikiTablesVariableFreeExecutor(table_data)
+        for logical_form in ["(filter_number_greater all_rows number_column:attendance (unknown_function))",
+                             "(filter_date_equals all_rows date_column:date (unknown_function))",
+                             "(filter_in all_rows string_column:league (unknown_function))"]:
+            assert executor.execute(logical_form) == []
+
     def test_date_comparison_works(self):
         assert Date(2013, 12, 31) > Date(2013, 12, 30)
         assert Date(2013, 12, 31) == Date(2013, 12, -1)
@@ -410,6 +438,28 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
         # TODO (pradeep): Figure out whether this is expected behavior by looking at data.
         assert (Date(2018, -1, 1) >= Date(2018, -1, 3)) == False
 
+    def test_date_comparison_works_with_unpackable_fields(self):
+        # Fields that do not fit in the packed key are compared field by field, with the same
+        # semantics.
+        assert Date(2013, 100000, 1) > Date(2013, 12, 31)
+        assert Date(-5, 1, 1) < Date(2013, 1, 1)
+        assert Date(2013, 100000, -1) == Date(2013, 100000, 4)
+        # pylint: disable=singleton-comparison
+        assert (Date(2013, 100000, -1) > Date(2013, 100000, 4)) == False
+
+    def test_date_hash_is_cached_and_not_pickled(self):
+        date = Date(2013, 12, -1)
+        assert hash(date) == hash(str(date)) == hash(date)
+        unpickled_date = pickle.loads(pickle.dumps(date))
+        assert hash(unpickled_date) == hash(date)
+        assert unpickled_date == Date(2013, 12, 31)
+
+    def test_date_fields_are_read_only(self):
+        date = Date(2013, 12, -1)
+        with pytest.raises(AttributeError):
+            date.day = 31
+        assert date == Date(2013, 12, 30)
+
     def test_number_comparison_works(self):
         # TableQuestionContext normlaizes all strings according to some rules. We want to ensure
         # that the original numerical values of number cells is being correctly processed here.
@@ -428,8 +478,42 @@ class TestWikiTablesVariableFreeExecutor(AllenNlpTestCase):
                                                                   "USL First Division"])
 
     def test_evaluate_logical_form_with_invalid_logical_form(self):
+        get_diagnostic_counts(reset=True)
         logical_form = """(select_string (same_as (filter_in all_rows string_column:league INVALID_CONSTANT)
                                    string_column:playoffs)
                            string_column:league)"""
         assert not self.executor.evaluate_logical_form(logical_form, ["USL A-League",
                                                                       "USL First Division"])
+        assert get_diagnostic_counts(reset=True) == {"execution_error": 1}
+        assert get_diagnostic_counts() == {}
+
+    def test_execute_logical_forms_matches_execute(self):
+        logical_forms = ["(count (filter_in all_rows string_column:league string:a_league))",
+                         "(select_string (first (filter_in all_rows string_column:league string:a_league)) "
+                         "string_column:playoffs)",
+                         "(count (first (filter_in all_rows string_column:league string:a_league)))",
+                         "(count (filter_number_greater all_rows number_column:avg_attendance all_rows))",
+                         "(max_date all_rows date_column:date)",
+                         "all_rows"]
+        denotations = self.executor.execute_logical_forms(logical_forms)
+        assert denotations[:3] == [1.0, ["quarterfinals"], 1.0]
+        # The invalid logical form gets a None denotation.
+        assert denotations[3] is None
+        assert denotations[4] == self.executor.execute(logical_forms[4])
+        assert denotations[5] == self.executor.table_data
+        # Denotations are not kept across batches, whose expressions can get the ids of the
+        # expressions of earlier batches.
+        assert [self.executor.execute_logical_forms([logical_form])[0]
+                for logical_form in logical_forms] == denotations
+
+    def test_evaluate_logical_forms(self):
+        logical_forms = ["""(select_string (same_as (filter_in all_rows string_column:league string:a_league)
+                                   string_column:playoffs) string_column:league)""",
+                         "(select_string (filter_in all_rows string_column:league string:a_league) "
+                         "string_column:league)",
+                         "(select_string (same_as (filter_in all_rows string_column:league INVALID_CONSTANT) "
+                         "string_column:playoffs) string_column:league)"]
+        assert self.executor.evaluate_logical_forms(logical_forms, ["USL A-League",
+                                                                    "USL First Division"]) == [True,
+                                                                                               False,
+                                                                                               False]
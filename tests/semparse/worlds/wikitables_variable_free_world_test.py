@@ -2,15 +2,31 @@
 # pylint: disable=invalid-name
 # pylint: disable=too-many-public-methods
 from typing import List
+import gc
+import os
+import glob
+import gzip
+import pickle
+import shutil
+import tarfile
 from functools import partial
 
+import pytest
+
 from allennlp.common.testing import AllenNlpTestCase
-from allennlp.data.tokenizers import Token
+from allennlp.data.dataset_readers.semantic_parsing.wikitables import util as wikitables_util
+from allennlp.data.fields import KnowledgeGraphField
+from allennlp.data.token_indexers import SingleIdTokenIndexer
+from allennlp.data.tokenizers import Token, WordTokenizer
+from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
 from allennlp.semparse import ParsingError
+from allennlp.semparse.worlds.world import World
 
-from weak_supervision.semparse.contexts import TableQuestionContext
+from weak_supervision.common import LruCache
+from weak_supervision.semparse.contexts import TableQuestionContext, table_io
 from weak_supervision.semparse.type_declarations import wikitables_variable_free as types
-from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld
+from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld, LazyWikiTablesVariableFreeWorld
+from weak_supervision.semparse.worlds import wikitables_variable_free_world
 
 
 def check_productions_match(actual_rules: List[str], expected_right_sides: List[str]):
@@ -154,6 +170,28 @@ class TestWikiTablesVariableFreeWorld(AllenNlpTestCase):
                                  '[<r,<t,<s,r>>>, r, t, s]',
                                  '[<r,r>, r]'])
 
+    def test_valid_actions_with_cached_schema_match_full_computation(self):
+        # Both worlds have the same schema, so the second one reuses the cached global productions.
+        for world in [self.world_with_2013, self.world_with_usl_a_league]:
+            assert world.get_valid_actions() == World.get_valid_actions(world.__class__(world.table_context))
+        other_table_file = self.FIXTURES_ROOT / 'data' / 'corenlp_processed_tables' / 'TEST-2.table'
+        other_context = TableQuestionContext.read_from_file(other_table_file, [Token('how'), Token('many')])
+        other_world = WikiTablesVariableFreeWorld(other_context)
+        assert other_world.get_valid_actions() == World.get_valid_actions(
+                WikiTablesVariableFreeWorld(other_context))
+
+    def test_terminal_productions_with_cached_schema_match_full_computation(self):
+        for world in [self.world_with_2013, self.world_with_usl_a_league]:
+            signatures = {**world.global_type_signatures, **world.local_type_signatures}
+            expected_productions = {}
+            for name_mapping in [world.global_name_mapping, world.local_name_mapping]:
+                for predicate, mapped_name in name_mapping.items():
+                    if mapped_name in signatures:
+                        expected_productions[predicate] = f"{signatures[mapped_name]} -> {predicate}"
+            assert world.terminal_productions == expected_productions
+        assert self.world_with_2013.terminal_productions['2013'] == 'n -> 2013'
+        assert '2013' not in self.world_with_usl_a_league.terminal_productions
+
     def test_parsing_logical_form_with_string_not_in_question_fails(self):
         logical_form_with_usl_a_league = """(select (filter_in all_rows string_column:league usl_a_league)
                                              date_column:year)"""
@@ -201,6 +239,60 @@ class TestWikiTablesVariableFreeWorld(AllenNlpTestCase):
                              'm -> date_column:year']
         assert self.world_with_usl_a_league.get_action_sequence(expression) == expected_sequence
 
+    def test_action_sequence_for_logical_form_matches_nltk_route(self):
+        world = self.world_with_usl_a_league
+        logical_forms = ["(select_string (same_as (filter_in all_rows string_column:league string:usl_a_league) "
+                         "string_column:league) string_column:league)",
+                         "(argmax all_rows number_column:division)",
+                         "(select_date (filter_date_greater all_rows date_column:year (date 2013 -1 -1)) "
+                         "date_column:year)",
+                         "(diff (first all_rows) (last all_rows) number_column:division)",
+                         "(count all_rows)",
+                         "all_rows",
+                         # Ill-typed, which we leave to NLTK.
+                         "(select_number all_rows string_column:league)"]
+        for logical_form in logical_forms:
+            self._check_action_sequence_matches_nltk_route(world, logical_form)
+        with self.assertRaises(ParsingError):
+            world.get_action_sequence_for_logical_form("(select_string all_rows string_column:nation)")
+
+    def test_action_sequence_for_logical_form_matches_nltk_route_on_search_output(self):
+        # All the logical forms in the offline search output fixtures, on the tables of their questions.
+        tokenizer = WordTokenizer(SpacyWordSplitter(pos_tags=True))
+        worlds = {}
+        with open("fixtures/data/wikitables/sample_data.examples") as examples_file:
+            for line in examples_file:
+                parsed_info = wikitables_util.parse_example_line(line)
+                table_filename = os.path.join("fixtures/data/wikitables",
+                                              parsed_info["table_filename"].replace("csv", "tagged"))
+                question_tokens = tokenizer.tokenize(parsed_info["question"].lower())
+                table_context = TableQuestionContext.read_from_file(table_filename, question_tokens)
+                worlds[parsed_info["id"]] = WikiTablesVariableFreeWorld(table_context)
+        logical_forms_by_id = {}
+        for filename in glob.glob("fixtures/data/wikitables/action_space_walker_output/*.gz"):
+            with gzip.open(filename, "rt") as logical_forms_file:
+                logical_forms_by_id[os.path.basename(filename)[:-3]] = logical_forms_file.read().split("\n")
+        tarball_filename = ("fixtures/data/wikitables/action_space_walker_output_with_single_tarball/"
+                            "all_lfs_tarball.tar.gz")
+        with tarfile.open(tarball_filename, mode="r:gz") as tarball:
+            for member in tarball.getmembers():
+                with gzip.open(tarball.extractfile(member), "rt") as logical_forms_file:
+                    logical_forms_by_id[member.name[:-3]] += logical_forms_file.read().split("\n")
+        assert logical_forms_by_id
+        for example_id, logical_forms in logical_forms_by_id.items():
+            for logical_form in logical_forms:
+                if logical_form.strip():
+                    self._check_action_sequence_matches_nltk_route(worlds[example_id], logical_form.strip())
+
+    def _check_action_sequence_matches_nltk_route(self, world: WikiTablesVariableFreeWorld, logical_form: str):
+        try:
+            expected_actions = world.get_action_sequence(world.parse_logical_form(logical_form))
+        except Exception as error:  # pylint: disable=broad-except
+            with self.assertRaises(type(error)):
+                world.get_action_sequence_for_logical_form(logical_form)
+        else:
+            assert world.get_action_sequence_for_logical_form(logical_form) == expected_actions, logical_form
+
     def test_world_gets_logical_form_from_actions(self):
         # pylint: disable=line-too-long
         logical_form = """(select_date (filter_in all_rows string_column:league string:usl_a_league) date_column:year)"""
@@ -209,6 +301,40 @@ class TestWikiTablesVariableFreeWorld(AllenNlpTestCase):
         reconstructed_logical_form = self.world_with_usl_a_league.get_logical_form(action_sequence)
         assert logical_form == reconstructed_logical_form
 
+    def test_get_logical_form_matches_base_class(self):
+        world = self.world_with_2013
+        logical_form = ("(select_date (filter_date_greater all_rows date_column:year (date 2013 -1 -1)) "
+                        "date_column:year)")
+        action_sequence = world.get_action_sequence_for_logical_form(logical_form)
+        for add_var_function in [True, False]:
+            assert world.get_logical_form(action_sequence, add_var_function) == \
+                    World.get_logical_form(world, action_sequence, add_var_function)
+        # Both raise errors on incomplete and mismatched action sequences.
+        for invalid_sequence in [action_sequence[:-1], action_sequence[:2] + action_sequence[3:],
+                                 action_sequence + ['r -> all_rows']]:
+            with self.assertRaises(ParsingError):
+                world.get_logical_form(invalid_sequence)
+
+    def test_execute_action_sequence_matches_executing_logical_form(self):
+        tokens = [Token(x) for x in ['which', 'usl', 'a', 'league', 'years', 'were', 'after', '2005', '?']]
+        world = self._get_world_with_question_tokens(tokens)
+        logical_forms = ["(select_date (filter_in all_rows string_column:league string:usl_a_league) "
+                         "date_column:year)",
+                         "(select_date (filter_number_greater all_rows number_column:year 2005) "
+                         "date_column:year)",
+                         "(count (filter_in all_rows string_column:league string:usl_a_league))",
+                         "all_rows"]
+        action_sequences = [world.get_action_sequence_for_logical_form(logical_form)
+                            for logical_form in logical_forms]
+        for logical_form, action_sequence in zip(logical_forms, action_sequences):
+            assert str(world.execute_action_sequence(action_sequence)) == str(world.execute(logical_form))
+        assert world.evaluate_action_sequence(action_sequences[2], ["1"])
+        assert not world.evaluate_action_sequence(action_sequences[2], ["2"])
+        assert world.evaluate_action_sequences(action_sequences, ["1"]) == \
+                world.evaluate_logical_forms(logical_forms, ["1"])
+        with self.assertRaises(ParsingError):
+            world.execute_action_sequence(action_sequences[0][:-1])
+
     def test_world_processes_logical_forms_with_number_correctly(self):
         tokens = [Token(x) for x in ['when', 'was', 'the', 'attendance', 'higher', 'than', '3000',
                                      '?']]
@@ -411,3 +537,118 @@ class TestWikiTablesVariableFreeWorld(AllenNlpTestCase):
                                            'f -> number_column:year',
                                            'm -> date_column:year'}
         assert set(world.get_agenda(conservative=True)) == {'<r,r> -> last'}
+
+    def test_get_agenda_is_cached_per_conservative_flag(self):
+        tokens = [Token(x) for x in ['what', 'was', 'the', 'top', 'year', '?']]
+        world = self._get_world_with_question_tokens(tokens)
+        agenda = world.get_agenda()
+        conservative_agenda = world.get_agenda(conservative=True)
+        # Changing a returned agenda does not change the cached one.
+        agenda.append('n -> 2013')
+        assert world.get_agenda() == agenda[:-1]
+        assert world.get_agenda(conservative=True) == conservative_agenda == ['<r,r> -> first']
+
+    def test_lazy_world_builds_world_when_used(self):
+        lazy_world = LazyWikiTablesVariableFreeWorld(self.table_context)
+        assert lazy_world.get_agenda() == self.world_with_2013.get_agenda()
+        assert lazy_world.all_possible_actions() == self.world_with_2013.all_possible_actions()
+        assert isinstance(lazy_world.get_world(), WikiTablesVariableFreeWorld)
+        world = self.world_with_2013
+        assert lazy_world.get_valid_actions() == world.get_valid_actions()
+        assert lazy_world.terminal_productions == world.terminal_productions
+        assert lazy_world.table_graph.entities == world.table_graph.entities
+        action_sequence = world.get_action_sequence_for_logical_form("(max_date all_rows date_column:year)")
+        assert lazy_world.get_logical_form(action_sequence) == world.get_logical_form(action_sequence)
+        assert lazy_world.evaluate_action_sequence(action_sequence, ["2005"])
+        assert lazy_world.evaluate_logical_form("(max_date all_rows date_column:year)", ["2005"])
+        # Lazy worlds are pickled without their worlds.
+        unpickled_world = pickle.loads(pickle.dumps(lazy_world))
+        assert unpickled_world.all_possible_actions() == lazy_world.all_possible_actions()
+
+    def test_lazy_worlds_keep_their_worlds_in_a_bounded_cache(self):
+        materialized_worlds = LruCache(1)
+        lazy_world = LazyWikiTablesVariableFreeWorld(self.table_context, materialized_worlds)
+        other_lazy_world = LazyWikiTablesVariableFreeWorld(self.table_context, materialized_worlds)
+        world = lazy_world.get_world()
+        assert lazy_world.get_world() is world
+        other_lazy_world.get_agenda()
+        assert len(materialized_worlds) == 1
+        assert lazy_world.get_world() is not world
+
+    def test_lazy_worlds_drop_their_worlds_when_collected(self):
+        materialized_worlds = LruCache(3)
+        lazy_world = LazyWikiTablesVariableFreeWorld(self.table_context, materialized_worlds)
+        lazy_world_in_cycle = LazyWikiTablesVariableFreeWorld(self.table_context, materialized_worlds)
+        other_lazy_world = LazyWikiTablesVariableFreeWorld(self.table_context, materialized_worlds)
+        lazy_world.get_world()
+        lazy_world_in_cycle.get_world()
+        other_world = other_lazy_world.get_world()
+        assert len(materialized_worlds) == 3
+        cycle = [lazy_world_in_cycle]
+        cycle.append(cycle)
+        del lazy_world, lazy_world_in_cycle, cycle
+        gc.collect()
+        # The worlds of collected lazy worlds are dropped the next time a lazy world gets its world,
+        # and a new lazy world never gets the world of a collected one.
+        assert other_lazy_world.get_world() is other_world
+        assert len(materialized_worlds) == 1
+        new_lazy_world = LazyWikiTablesVariableFreeWorld(self.table_context, materialized_worlds)
+        assert new_lazy_world.get_world() is not other_world
+        assert len(materialized_worlds) == 2
+
+    def test_world_is_rebuilt_when_unpickled(self):
+        for world in [self.world_with_2013, self.world_with_usl_a_league]:
+            assert world.__getstate__()["table_context"] is None
+            table_field = KnowledgeGraphField(world.table_graph,
+                                              world.table_context.question_tokens,
+                                              {"tokens": SingleIdTokenIndexer()})
+            unpickled_world, unpickled_table_field = pickle.loads(pickle.dumps((world, table_field)))
+            assert unpickled_world.table_context.question_tokens[-2].text == \
+                    world.table_context.question_tokens[-2].text
+            assert unpickled_world.all_possible_actions() == world.all_possible_actions()
+            assert unpickled_world.get_agenda() == world.get_agenda()
+            assert unpickled_world.execute("(max_date all_rows date_column:year)") == \
+                    world.execute("(max_date all_rows date_column:year)")
+            # The world shares the graph of the table field it is pickled with, so the parser sees the
+            # entities in the same order in both.
+            assert unpickled_world.table_graph is unpickled_table_field.knowledge_graph
+            assert list(unpickled_world.table_graph.entities) == \
+                    list(unpickled_table_field.knowledge_graph.entities)
+
+    def test_world_is_unpickled_from_its_table_file(self):
+        table_io.clear_table_cache()
+        table_file = self.TEST_DIR / 'table.tagged'
+        shutil.copy(self.table_file, table_file)
+        world = WikiTablesVariableFreeWorld(TableQuestionContext.read_from_file(table_file, []))
+        pickled_world = pickle.dumps(world)
+        unpickled_world = pickle.loads(pickled_world)
+        assert unpickled_world.table_context.table_data == world.table_context.table_data
+        assert unpickled_world.all_possible_actions() == world.all_possible_actions()
+        # Worlds about the same table share it when unpickled, without reading the file again.
+        os.remove(table_file)
+        other_unpickled_world = pickle.loads(pickled_world)
+        assert other_unpickled_world.table_context.table_data is unpickled_world.table_context.table_data
+        table_io.clear_table_cache()
+        with pytest.raises(ValueError):
+            pickle.loads(pickled_world)
+
+    def test_tables_not_read_from_files_are_pickled_with_worlds_if_asked(self):
+        table_io.clear_table_cache()
+        lines = [line.strip("\n").split("\t") for line in open(self.table_file)]
+        world = WikiTablesVariableFreeWorld(TableQuestionContext.read_from_lines(lines, []))
+        with pytest.raises(ValueError):
+            pickle.loads(pickle.dumps(world))
+        wikitables_variable_free_world.PICKLE_TABLES_WITH_WORLDS = True
+        try:
+            unpickled_world = pickle.loads(pickle.dumps(world))
+        finally:
+            wikitables_variable_free_world.PICKLE_TABLES_WITH_WORLDS = False
+        assert unpickled_world.table_context.table_data == world.table_context.table_data
+        assert unpickled_world.all_possible_actions() == world.all_possible_actions()
+
+    def test_instance_specific_action_flags_match_classifying_actions(self):
+        for world in [self.world_with_2013, self.world_with_usl_a_league]:
+            actions = world.all_possible_actions()
+            expected_flags = [world.is_instance_specific_entity(action.split(' -> ')[1]) for action in actions]
+            assert world.get_instance_specific_action_flags() == expected_flags
+            assert any(expected_flags) and not all(expected_flags)
@@ -0,0 +1 @@
+from weak_supervision.common.lru_cache import LruCache
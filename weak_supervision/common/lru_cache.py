@@ -0,0 +1,63 @@
+from typing import Callable, Dict, Generic, Hashable, TypeVar
+from collections import OrderedDict
+
+KeyType = TypeVar('KeyType', bound=Hashable)  # pylint: disable=invalid-name
+ValueType = TypeVar('ValueType')  # pylint: disable=invalid-name
+
+
+class LruCache(Generic[KeyType, ValueType]):
+    """
+    A mapping that keeps at most ``max_size`` items, and drops the least recently used one when an
+    item is added beyond that. Getting an item (with ``[]``, ``get`` or ``get_or_add``) or setting
+    it marks it as the most recently used; checking if it is in the cache does not. We use this for
+    all the per-table and per-world caches, so that they all evict items the same way.
+
+    Parameters
+    ----------
+    max_size : ``int``
+        The number of items to keep.
+    """
+    def __init__(self, max_size: int) -> None:
+        if max_size < 1:
+            raise ValueError(f"Cache size should be positive, got {max_size}")
+        self.max_size = max_size
+        self._items: Dict[KeyType, ValueType] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: KeyType) -> bool:
+        return key in self._items
+
+    def __getitem__(self, key: KeyType) -> ValueType:
+        value = self._items[key]
+        self._items.move_to_end(key)  # type: ignore # pylint: disable=no-member
+        return value
+
+    def __setitem__(self, key: KeyType, value: ValueType) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)  # type: ignore # pylint: disable=no-member
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)  # type: ignore
+
+    def get(self, key: KeyType, default: ValueType = None) -> ValueType:
+        if key not in self._items:
+            return default
+        return self[key]
+
+    def get_or_add(self, key: KeyType, make_value: Callable[[], ValueType]) -> ValueType:
+        """
+        Returns the item for ``key``, adding the value returned by ``make_value`` first if there is
+        none.
+        """
+        if key in self._items:
+            return self[key]
+        value = make_value()
+        self[key] = value
+        return value
+
+    def discard(self, key: KeyType) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
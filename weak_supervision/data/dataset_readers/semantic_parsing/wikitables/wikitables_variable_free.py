@@ -6,35 +6,51 @@ for a model that uses the variable free language defined in
 
 import logging
 from typing import Dict, List
+from collections import Counter
 import os
 import gzip
 import tarfile
 
 from overrides import overrides
 
+from allennlp.common.checks import ConfigurationError
 from allennlp.data.instance import Instance
 from allennlp.data.fields import (Field, TextField, MetadataField, ProductionRuleField,
                                   ListField, IndexField, KnowledgeGraphField)
 from allennlp.data.dataset_readers.dataset_reader import DatasetReader
 from allennlp.data.dataset_readers.semantic_parsing.wikitables import util as wikitables_util
-from allennlp.data.tokenizers import WordTokenizer
+from allennlp.data.tokenizers import Token, WordTokenizer
 from allennlp.data.tokenizers.tokenizer import Tokenizer
 from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
 from allennlp.data.token_indexers import SingleIdTokenIndexer
 from allennlp.data.token_indexers.token_indexer import TokenIndexer
+from allennlp.semparse.contexts.knowledge_graph import KnowledgeGraph
 from allennlp.semparse.worlds.world import ParsingError
 
-from weak_supervision.semparse.contexts import TableQuestionContext
-from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld
+from weak_supervision.common import LruCache
+from weak_supervision.semparse.contexts import TableQuestionContext, table_io
+from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld, LazyWikiTablesVariableFreeWorld
+from weak_supervision.semparse.worlds.wikitables_variable_free_world import MAX_MATERIALIZED_WORLDS
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+MAX_CACHED_ENTITY_TEXTS = 100000
+
 
 @DatasetReader.register("wikitables_variable_free")
 class WikiTablesVariableFreeDatasetReader(DatasetReader):
     """
     This ``DatasetReader`` takes WikiTableQuestions ``*.examples`` files and converts them into
     ``Instances`` suitable for use with the ``WikiTablesVariableFreeSemanticParser``.
+
+    If ``compact_table_rows`` is set, the rows of the tables in the worlds are stored as
+    ``TableRows`` instead of dicts (see ``TableQuestionContext.compact_table_data``), which saves a
+    lot of memory when the whole dataset is read at once, at a small cost in execution speed.
+
+    If ``lazy_worlds`` is set, the instances hold ``LazyWikiTablesVariableFreeWorlds``, which build
+    their worlds when the model first uses them. The reader keeps the worlds of the
+    ``MAX_MATERIALIZED_WORLDS`` most recently used instances it made, and the others are built
+    again when the model uses them. This also saves memory when the whole dataset is read at once.
     """
     def __init__(self,
                  lazy: bool = False,
@@ -47,7 +63,10 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
                  table_token_indexers: Dict[str, TokenIndexer] = None,
                  use_table_for_vocab: bool = False,
                  max_table_tokens: int = None,
-                 output_agendas: bool = False) -> None:
+                 output_agendas: bool = False,
+                 compact_table_rows: bool = False,
+                 num_table_reading_threads: int = table_io.DEFAULT_TABLE_READING_THREADS,
+                 lazy_worlds: bool = False) -> None:
         super().__init__(lazy=lazy)
         self._tables_directory = tables_directory
         self._offline_logical_forms_directory = offline_logical_forms_directory
@@ -59,6 +78,15 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
         self._use_table_for_vocab = use_table_for_vocab
         self._max_table_tokens = max_table_tokens
         self._output_agendas = output_agendas
+        self._compact_table_rows = compact_table_rows
+        self._num_table_reading_threads = num_table_reading_threads
+        self._lazy_worlds = lazy_worlds
+        self._materialized_worlds: LruCache[int, WikiTablesVariableFreeWorld] = None
+        if lazy_worlds:
+            self._materialized_worlds = LruCache(MAX_MATERIALIZED_WORLDS)
+        # Tokenized entity text, which is mostly column names that are shared by all the questions
+        # about a table.
+        self._entity_tokens_cache: LruCache[str, List[Token]] = LruCache(MAX_CACHED_ENTITY_TEXTS)
 
     @overrides
     def _read(self, file_path: str):
@@ -80,17 +108,42 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
                 self._offline_logical_forms_directory = "/tmp/"
                 tarfile.open(tarball_with_all_lfs,
                              mode='r:gz').extractall(path=self._offline_logical_forms_directory)
+        counts: Dict[str, int] = Counter()
+        # The tables are read ahead of the instances we are making, on a few threads, so that we
+        # don't wait on opening each table file in turn. Tables pre-parsed by
+        # ``scripts/wikitables/preprocess_tables.py`` are read from their binary files, which is
+        # much faster.
+        table_contexts = table_io.read_from_files(self._read_examples(file_path, counts),
+                                                  num_threads=self._num_table_reading_threads,
+                                                  compact_table_data=self._compact_table_rows)
+        num_instances = 0
+        for table_context, (parsed_info, logical_forms) in table_contexts:
+            instance = self.text_to_instance(question=parsed_info["question"],
+                                             table_context=table_context,
+                                             target_values=parsed_info["target_values"],
+                                             offline_search_output=logical_forms)
+            if instance is not None:
+                num_instances += 1
+                yield instance
+
+        if self._offline_logical_forms_directory:
+            logger.info(f"Missing logical forms for {counts['missing_logical_forms']} out of "
+                        f"{counts['lines']} instances")
+            logger.info(f"Kept {num_instances} instances")
+
+    def _read_examples(self, file_path: str, counts: Dict[str, int]):
+        """
+        Yields the table file name, the tokenized question, and the parsed example line and offline
+        logical forms of each example in the file, as ``table_io.read_from_files``
+        takes them. Counts the lines and the examples missing logical forms in ``counts``.
+        """
         with open(file_path, "r") as data_file:
-            num_missing_logical_forms = 0
-            num_lines = 0
-            num_instances = 0
-            for line in data_file.readlines():
+            for line in data_file:
                 line = line.strip("\n")
                 if not line:
                     continue
-                num_lines += 1
+                counts["lines"] += 1
                 parsed_info = wikitables_util.parse_example_line(line)
-                question = parsed_info["question"]
                 # We want the tagged file, but the ``*.examples`` files typically point to CSV.
                 table_filename = os.path.join(self._tables_directory,
                                               parsed_info["table_filename"].replace("csv", "tagged"))
@@ -105,30 +158,20 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
                     except FileNotFoundError:
                         logger.debug(f'Missing search output for instance {parsed_info["id"]}; skipping...')
                         logical_forms = None
-                        num_missing_logical_forms += 1
+                        counts["missing_logical_forms"] += 1
                         if not self._keep_if_no_logical_forms:
                             continue
                 else:
                     logical_forms = None
-
-                table_lines = [line.split("\t") for line in open(table_filename).readlines()]
-                instance = self.text_to_instance(question=question,
-                                                 table_lines=table_lines,
-                                                 target_values=parsed_info["target_values"],
-                                                 offline_search_output=logical_forms)
-                if instance is not None:
-                    num_instances += 1
-                    yield instance
-
-        if self._offline_logical_forms_directory:
-            logger.info(f"Missing logical forms for {num_missing_logical_forms} out of {num_lines} instances")
-            logger.info(f"Kept {num_instances} instances")
+                question_tokens = self._tokenizer.tokenize(parsed_info["question"].lower())
+                yield table_filename, question_tokens, (parsed_info, logical_forms)
 
     def text_to_instance(self,  # type: ignore
                          question: str,
-                         table_lines: List[List[str]],
-                         target_values: List[str],
-                         offline_search_output: List[str] = None) -> Instance:
+                         table_lines: List[List[str]] = None,
+                         target_values: List[str] = None,
+                         offline_search_output: List[str] = None,
+                         table_context: TableQuestionContext = None) -> Instance:
         """
         Reads text inputs and makes an instance. WikitableQuestions dataset provides tables as
         TSV files pre-tagged using CoreNLP, which we use for training.
@@ -137,34 +180,52 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
         ----------
         question : ``str``
             Input question
-        table_lines : ``List[List[str]]``
+        table_lines : ``List[List[str]]``, optional
             The table content preprocessed by CoreNLP. See ``TableQuestionContext.read_from_lines``
-            for the expected format.
+            for the expected format. Either this or ``table_context`` should be given.
         target_values : ``List[str]``
         offline_search_output : List[str], optional
             List of logical forms, produced by offline search. Not required during test.
+        table_context : ``TableQuestionContext``, optional
+            The table and the tokenized question, already read (``_read`` reads them ahead on a few
+            threads). The question should be tokenized by this reader's tokenizer, in lower case.
         """
         # pylint: disable=arguments-differ
-        tokenized_question = self._tokenizer.tokenize(question.lower())
+        if (table_lines is None) == (table_context is None):
+            raise ConfigurationError("Exactly one of table_lines and table_context should be given")
+        if table_context is None:
+            tokenized_question = self._tokenizer.tokenize(question.lower())
+            table_context = TableQuestionContext.read_from_lines(table_lines, tokenized_question)
+        tokenized_question = table_context.question_tokens
         question_field = TextField(tokenized_question, self._question_token_indexers)
-        # TODO(pradeep): We'll need a better way to input CoreNLP processed lines.
-        table_context = TableQuestionContext.read_from_lines(table_lines, tokenized_question)
+        if self._compact_table_rows:
+            table_context.compact_table_data()
         target_values_field = MetadataField(target_values)
+        # We use this world to make the fields below. It only builds the grammar (mostly from the
+        # caches shared by all the tables with the same column types), and no executor. With lazy
+        # worlds, the instance gets a lazy world instead, and this one is dropped once the instance
+        # is made, so the model builds the world again when it uses it. The lazy world keeps the
+        # context, whose knowledge graph is the one in the table field below, so that is not built
+        # again.
         world = WikiTablesVariableFreeWorld(table_context)
-        world_field = MetadataField(world)
+        if self._lazy_worlds:
+            world_field = MetadataField(LazyWikiTablesVariableFreeWorld(table_context, self._materialized_worlds))
+        else:
+            world_field = MetadataField(world)
         # Note: Not passing any featre extractors when instantiating the field below. This will make
         # it use all the available extractors.
-        table_field = KnowledgeGraphField(table_context.get_table_knowledge_graph(),
+        table_knowledge_graph = table_context.get_table_knowledge_graph()
+        table_field = KnowledgeGraphField(table_knowledge_graph,
                                           tokenized_question,
                                           self._table_token_indexers,
                                           tokenizer=self._tokenizer,
+                                          entity_tokens=self._get_entity_tokens(table_knowledge_graph),
                                           include_in_vocab=self._use_table_for_vocab,
                                           max_table_tokens=self._max_table_tokens)
         production_rule_fields: List[Field] = []
-        for production_rule in world.all_possible_actions():
-            _, rule_right_side = production_rule.split(' -> ')
-            is_global_rule = not world.is_instance_specific_entity(rule_right_side)
-            field = ProductionRuleField(production_rule, is_global_rule=is_global_rule)
+        for production_rule, is_instance_specific in zip(world.all_possible_actions(),
+                                                         world.get_instance_specific_action_flags()):
+            field = ProductionRuleField(production_rule, is_global_rule=not is_instance_specific)
             production_rule_fields.append(field)
         action_field = ListField(production_rule_fields)
 
@@ -183,17 +244,16 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
             action_sequence_fields: List[Field] = []
             for logical_form in offline_search_output:
                 try:
-                    expression = world.parse_logical_form(logical_form)
+                    action_sequence = world.get_action_sequence_for_logical_form(logical_form)
                 except ParsingError as error:
                     logger.debug(f'Parsing error: {error.message}, skipping logical form')
                     logger.debug(f'Question was: {question}')
                     logger.debug(f'Logical form was: {logical_form}')
-                    logger.debug(f'Table info was: {table_lines}')
+                    logger.debug(f'Table info was: {table_context.table_id}')
                     continue
                 except:
                     logger.error(logical_form)
                     raise
-                action_sequence = world.get_action_sequence(expression)
                 try:
                     index_fields: List[Field] = []
                     for production_rule in action_sequence:
@@ -202,7 +262,7 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
                 except KeyError as error:
                     logger.debug(f'Missing production rule: {error.args}, skipping logical form')
                     logger.debug(f'Question was: {question}')
-                    logger.debug(f'Table info was: {table_lines}')
+                    logger.debug(f'Table info was: {table_context.table_id}')
                     logger.debug(f'Logical form was: {logical_form}')
                     continue
                 if len(action_sequence_fields) >= self._max_offline_logical_forms:
@@ -224,3 +284,17 @@ class WikiTablesVariableFreeDatasetReader(DatasetReader):
                 agenda_index_fields = [IndexField(-1, action_field)]
             fields['agenda'] = ListField(agenda_index_fields)
         return Instance(fields)
+
+    def _get_entity_tokens(self, knowledge_graph: KnowledgeGraph) -> List[List[Token]]:
+        """
+        Tokenizes the text of the entities in the graph the same way ``KnowledgeGraphField`` does,
+        but only the text we have not seen before.
+        """
+        entity_texts = [knowledge_graph.entity_text[entity].lower()
+                        for entity in knowledge_graph.entities]
+        entity_tokens = {text: self._entity_tokens_cache.get(text) for text in entity_texts}
+        new_entity_texts = [text for text, tokens in entity_tokens.items() if tokens is None]
+        for text, tokens in zip(new_entity_texts, self._tokenizer.batch_tokenize(new_entity_texts)):
+            self._entity_tokens_cache[text] = tokens
+            entity_tokens[text] = tokens
+        return [entity_tokens[text] for text in entity_texts]
@@ -15,6 +15,7 @@ from allennlp.state_machines.states import CoverageState, ChecklistStatelet
 from allennlp.state_machines.trainers import ExpectedRiskMinimization
 from allennlp.training.metrics import Average
 
+from weak_supervision.semparse.executors.util import log_diagnostic_counts
 from weak_supervision.semparse.worlds import WikiTablesVariableFreeWorld
 from weak_supervision.state_machines.transition_functions import LinkingCoverageTransitionFunction
 from weak_supervision.models.semantic_parsing.wikitables_variable_free.wikitables_variable_free_parser \
@@ -372,14 +373,10 @@ class WikiTablesVariableFreeErm(WikiTablesVariableFreeParser):
         action_history = state.action_history[0]
         batch_index = state.batch_indices[0]
         action_strings = [state.possible_actions[batch_index][i][0] for i in action_history]
-        logical_form = world.get_logical_form(action_strings)
         target_values = state.extras[batch_index]
         evaluation = False
         try:
-            executor_logger = \
-                    logging.getLogger('weak_supervision.semparse.executors.wikitables_variable_free_executor')
-            executor_logger.setLevel(logging.ERROR)
-            evaluation = world.evaluate_logical_form(logical_form, target_values)
+            evaluation = world.evaluate_action_sequence(action_strings, target_values)
         except IndexError:
             # TODO(pradeep): This happens due to a bug in "filter_in" and "filter_no_in" functions.
             # The value evaluation, if it is a list, could be an empty one. Fix it there!
@@ -394,8 +391,12 @@ class WikiTablesVariableFreeErm(WikiTablesVariableFreeParser):
     def get_metrics(self, reset: bool = False) -> Dict[str, float]:
         """
         The base class returns a dict with dpd accuracy, denotation accuracy, and logical form
-        percentage metrics. We add the agenda coverage metric here.
+        percentage metrics. We add the agenda coverage metric here. When the metrics are reset (at
+        the end of each training or validation epoch), we also log how often the executor ran into
+        each kind of diagnostic event (see ``log_diagnostic_counts``) since the last reset.
         """
         metrics = super().get_metrics(reset)
         metrics["agenda_coverage"] = self._agenda_coverage.get_metric(reset)
+        if reset:
+            log_diagnostic_counts(reset=True)
         return metrics
@@ -114,6 +114,18 @@ class ActionSpaceWalker:
                                       max_num_logical_forms: int = None,
                                       allow_partial_match: bool = False) -> List[str]:
         """
+        Returns the logical forms of the action sequences that ``get_action_sequences_with_agenda``
+        returns, in the same order.
+        """
+        action_sequences = self.get_action_sequences_with_agenda(agenda, max_num_logical_forms,
+                                                                 allow_partial_match)
+        return [self._world.get_logical_form(path) for path in action_sequences]
+
+    def get_action_sequences_with_agenda(self,
+                                         agenda: List[str],
+                                         max_num_logical_forms: int = None,
+                                         allow_partial_match: bool = False) -> List[List[str]]:
+        """
         Parameters
         ----------
         agenda : ``List[str]``
@@ -126,7 +138,7 @@ class ActionSpaceWalker:
         if not agenda:
             if allow_partial_match:
                 logger.warning("Agenda is empty! Returning all paths instead.")
-                return self.get_all_logical_forms(max_num_logical_forms)
+                return self.get_all_action_sequences(max_num_logical_forms)
             return []
         if self._completed_paths is None:
             self._walk()
@@ -134,7 +146,7 @@ class ActionSpaceWalker:
         if all([not path_indices for path_indices in agenda_path_indices]):
             if allow_partial_match:
                 logger.warning("""Agenda items not in any of the paths found. Returning all paths.""")
-                return self.get_all_logical_forms(max_num_logical_forms)
+                return self.get_all_action_sequences(max_num_logical_forms)
             return []
         # We omit any agenda items that are not in any of the paths, since they would cause the
         # final intersection to be null.
@@ -170,11 +182,15 @@ class ActionSpaceWalker:
             paths = sorted([self._completed_paths[index] for index in indices_to_return], key=len)
         if max_num_logical_forms is not None:
             paths = paths[:max_num_logical_forms]
-        logical_forms = [self._world.get_logical_form(path) for path in paths]
-        return logical_forms
+        return paths
 
     def get_all_logical_forms(self,
                               max_num_logical_forms: int = None) -> List[str]:
+        return [self._world.get_logical_form(path) for path in
+                self.get_all_action_sequences(max_num_logical_forms)]
+
+    def get_all_action_sequences(self,
+                                 max_num_logical_forms: int = None) -> List[List[str]]:
         if self._completed_paths is None:
             self._walk()
         paths = self._completed_paths
@@ -182,5 +198,4 @@ class ActionSpaceWalker:
             if self._length_sorted_paths is None:
                 self._length_sorted_paths = sorted(self._completed_paths, key=len)
             paths = self._length_sorted_paths[:max_num_logical_forms]
-        logical_forms = [self._world.get_logical_form(path) for path in paths]
-        return logical_forms
+        return list(paths)
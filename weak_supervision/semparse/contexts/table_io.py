@@ -0,0 +1,294 @@
+"""
+Reading and writing the tables of ``TableQuestionContexts``: a pre-parsed binary format for CoreNLP
+tagged tables, reading the tables for many questions ahead of their use, on a pool of threads, and
+finding tables again by their ids.
+"""
+import os
+import sys
+import array
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple, Set, Optional, Iterable, Iterator, Deque, TypeVar
+from collections import defaultdict, deque
+
+from allennlp.data.tokenizers import Token
+
+from weak_supervision.common import LruCache
+from weak_supervision.semparse.contexts.table_question_context import (CellValueType, Date,
+                                                                       TableQuestionContext)
+
+# Whatever data callers of ``read_from_files`` pass along with each question.
+ExampleDataType = TypeVar('ExampleDataType')  # pylint: disable=invalid-name
+
+# The number of threads ``read_from_files`` uses by default to read tables ahead of the ones being
+# processed. Reading tables is mostly waiting on file system latency.
+DEFAULT_TABLE_READING_THREADS = 4
+# The number of most recently read tables ``read_from_files`` keeps, to reuse them for later
+# questions about the same tables.
+MAX_REUSED_TABLES = 128
+# The number of most recently used tables ``get_table_from_id`` keeps in each process.
+MAX_CACHED_TABLES = 128
+_CACHED_TABLES: LruCache[str, TableQuestionContext] = LruCache(MAX_CACHED_TABLES)
+
+# Extension and format version of the pre-parsed tables written by ``write_table_to_binary_file``.
+BINARY_TABLE_EXTENSION = ".bin"
+_BINARY_TABLE_MAGIC = b"WTQT"
+_BINARY_TABLE_FORMAT_VERSION = 1
+# Magic, format version, number of rows, number of cells, and length of the string table in bytes.
+# All the numbers in the file are little-endian.
+_BINARY_TABLE_HEADER = struct.Struct("<4sHxxIII")
+# Date fields are stored as signed 64-bit integers.
+_BINARY_DATE_FIELD_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def read_from_file(filename: str,
+                   question_tokens: List[Token],
+                   use_binary_file: bool = True,
+                   compact_table_data: bool = False) -> TableQuestionContext:
+    """
+    Reads a table from a binary file written by ``write_table_to_binary_file`` if ``filename`` has
+    the ``BINARY_TABLE_EXTENSION``, and from a CoreNLP tagged file with
+    ``TableQuestionContext.read_from_file`` otherwise. If ``use_binary_file`` is set, we read a
+    tagged table from its binary file instead when there is an up to date one (see
+    ``find_binary_table_file``). If ``compact_table_data`` is set, we call
+    ``TableQuestionContext.compact_table_data`` on the context.
+    """
+    if use_binary_file:
+        filename = find_binary_table_file(filename) or filename
+    if str(filename).endswith(BINARY_TABLE_EXTENSION):
+        context = read_from_binary_file(filename, question_tokens)
+    else:
+        context = TableQuestionContext.read_from_file(filename, question_tokens)
+    if compact_table_data:
+        context.compact_table_data()
+    return context
+
+
+def read_from_files(examples: Iterable[Tuple[str, List[Token], ExampleDataType]],
+                    num_threads: int = DEFAULT_TABLE_READING_THREADS,
+                    max_tables_ahead: int = None,
+                    use_binary_files: bool = True,
+                    compact_table_data: bool = False) -> Iterator[Tuple[TableQuestionContext,
+                                                                        ExampleDataType]]:
+    """
+    Reads tables from files with ``read_from_file``, on a pool of ``num_threads`` threads that read
+    up to ``max_tables_ahead`` tables (by default, four per thread) ahead of the one the caller is
+    processing, and yields the contexts in the order of ``examples``. This hides the latency of
+    opening many small files, which dominates the time it takes to read a dataset on network
+    storage.
+
+    Parameters
+    ----------
+    examples : ``Iterable[Tuple[str, List[Token], ExampleDataType]]``
+        The table file name, the question tokens and any other data of each example. This is
+        consumed lazily, so it can be a generator. We yield each context with the data of its
+        example, so that the caller does not need to keep the examples we have not yet yielded.
+    num_threads : ``int``, optional
+    max_tables_ahead : ``int``, optional
+    use_binary_files : ``bool``, optional
+        If set, we read each tagged table from its binary file instead, when there is an up to date
+        one (see ``find_binary_table_file``). We look for it on the reading threads too.
+    compact_table_data : ``bool``, optional
+        If set, we call ``compact_table_data`` on each table once, before sharing it between the
+        contexts for the questions about it.
+
+    An error reading a table is raised when we get to that table. Tables that were read recently
+    (the last ``MAX_REUSED_TABLES`` distinct files) are not read again for later questions; we make
+    their contexts with ``with_question`` instead.
+    """
+    max_tables_ahead = max_tables_ahead or 4 * num_threads
+    # The reads of the most recent tables, by file name. Each of them reads a context without a
+    # question, from which we make the contexts for all the questions about that table.
+    table_reads: LruCache[str, Future] = LruCache(MAX_REUSED_TABLES)
+    pending_reads: Deque[Tuple[Future, List[Token], ExampleDataType]] = deque()
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        try:
+            for filename, tokens, example_data in examples:
+                table_read = table_reads.get(filename)
+                if table_read is None:
+                    table_read = executor.submit(read_from_file, filename, [], use_binary_files,
+                                                 compact_table_data)
+                    table_reads[filename] = table_read
+                pending_reads.append((table_read, tokens, example_data))
+                if len(pending_reads) >= max_tables_ahead:
+                    table_read, tokens, example_data = pending_reads.popleft()
+                    yield table_read.result().with_question(tokens), example_data
+            while pending_reads:
+                table_read, tokens, example_data = pending_reads.popleft()
+                yield table_read.result().with_question(tokens), example_data
+        finally:
+            # If the caller stops early, we don't read the rest.
+            for table_read, _, _ in pending_reads:
+                table_read.cancel()
+
+
+def get_table_from_id(table_id: str, table_context: TableQuestionContext = None) -> TableQuestionContext:
+    """
+    Returns a context without a question for the table with the given id, from which callers make
+    the contexts for their questions with ``with_question``. We keep the ``MAX_CACHED_TABLES`` most
+    recently used tables, so that all the contexts made from them share the table. A table that is
+    not cached is ``table_context`` if it is given, and is otherwise read again with
+    ``read_from_file`` from the file it was read from (see
+    ``TableQuestionContext.get_table_file_from_id``). Raises a ``ValueError`` if there is no such
+    file, or if it has changed since.
+    """
+    def read_table() -> TableQuestionContext:
+        if table_context is not None:
+            return table_context
+        filename = TableQuestionContext.get_table_file_from_id(table_id)
+        if filename is None:
+            raise ValueError(f"Cannot find table {table_id}: it was not read from a file, or its file "
+                             "has changed since")
+        return read_from_file(filename, [])
+    return _CACHED_TABLES.get_or_add(table_id, read_table)
+
+
+def clear_table_cache() -> None:
+    _CACHED_TABLES.clear()
+
+
+def write_table_to_binary_file(context: TableQuestionContext, filename: str) -> None:
+    """
+    Writes the parsed table of ``context`` (but not the question) to a compact binary file, from
+    which ``read_from_binary_file`` can rebuild the context much faster than parsing the tagged file
+    again: column types are already resolved, and numbers, dates and normalized strings are stored
+    as they are in ``table_data``. Column names and strings are stored once in a string table, and
+    cells refer to them by index. Raises a ``ValueError`` if the table cannot be stored in this
+    format.
+    """
+    strings: List[str] = [context.table_id or ""]
+    string_indices: Dict[str, int] = {}
+    row_offsets = array.array("I", [0])
+    cell_columns = array.array("I")
+    cell_is_none = array.array("B")
+    cell_numbers = array.array("d")
+    cell_dates = array.array("q")
+    cell_strings = array.array("i")
+
+    def get_string_index(string: str) -> int:
+        if string not in string_indices:
+            string_indices[string] = len(strings)
+            strings.append(string)
+        return string_indices[string]
+
+    for row in context.table_data:
+        for column_name, cell_value in row.items():
+            cell_columns.append(get_string_index(column_name))
+            cell_is_none.append(cell_value is None)
+            cell_number = 0.0
+            cell_date = (0, 0, 0)
+            cell_string = -1
+            if isinstance(cell_value, Date):
+                cell_date = (cell_value.year, cell_value.month, cell_value.day)
+                if any(field not in _BINARY_DATE_FIELD_RANGE for field in cell_date):
+                    raise ValueError(f"Cannot write date {cell_value} of table {context.table_id} "
+                                     "to a binary file")
+            elif isinstance(cell_value, float):
+                cell_number = cell_value
+            elif isinstance(cell_value, str):
+                cell_string = get_string_index(cell_value)
+            cell_numbers.append(cell_number)
+            cell_dates.extend(cell_date)
+            cell_strings.append(cell_string)
+        row_offsets.append(len(cell_columns))
+    if any("\0" in string for string in strings):
+        # We use null characters to separate the strings.
+        raise ValueError(f"Cannot write table {context.table_id} to a binary file")
+    text = "\0".join(strings).encode("utf-8")
+    arrays = [row_offsets, cell_columns, cell_is_none, cell_numbers, cell_dates, cell_strings]
+    if sys.byteorder != "little":
+        for values in arrays:
+            values.byteswap()
+    with open(filename, "wb") as binary_file:
+        binary_file.write(_BINARY_TABLE_HEADER.pack(_BINARY_TABLE_MAGIC,
+                                                    _BINARY_TABLE_FORMAT_VERSION,
+                                                    len(context.table_data),
+                                                    len(cell_columns),
+                                                    len(text)))
+        binary_file.write(text)
+        for values in arrays:
+            values.tofile(binary_file)
+
+
+def read_from_binary_file(filename: str, question_tokens: List[Token]) -> TableQuestionContext:
+    """
+    Reads a table written by ``write_table_to_binary_file``. We read the whole file at once instead
+    of memory-mapping it, because tables are small, and all the time goes into building the row
+    dicts anyway.
+    """
+    with open(filename, "rb") as binary_file:
+        data = memoryview(binary_file.read())
+    magic, format_version, num_rows, num_cells, text_length = _BINARY_TABLE_HEADER.unpack_from(data)
+    if magic != _BINARY_TABLE_MAGIC or format_version != _BINARY_TABLE_FORMAT_VERSION:
+        raise ValueError(f"{filename} is not a binary table file in a format we can read")
+    offset = _BINARY_TABLE_HEADER.size
+    # Column names and cell strings are interned, as they are when we read tagged files.
+    strings = [sys.intern(string) for string in str(data[offset:offset + text_length], "utf-8").split("\0")]
+    offset += text_length
+    row_offsets, offset = _read_array(data, offset, "I", num_rows + 1)
+    cell_columns, offset = _read_array(data, offset, "I", num_cells)
+    cell_is_none, offset = _read_array(data, offset, "B", num_cells)
+    cell_numbers, offset = _read_array(data, offset, "d", num_cells)
+    cell_dates, offset = _read_array(data, offset, "q", 3 * num_cells)
+    cell_strings, offset = _read_array(data, offset, "i", num_cells)
+    table_id = strings[0] or None
+
+    column_types: Dict[str, Set[str]] = defaultdict(set)
+    # The type of the values under each column, by the index of its name in ``strings``.
+    column_value_types: Dict[int, str] = {}
+    table_data: List[Dict[str, CellValueType]] = []
+    for row_start, row_end in zip(row_offsets, row_offsets[1:]):
+        row: Dict[str, CellValueType] = {}
+        for cell_index in range(row_start, row_end):
+            column_index = cell_columns[cell_index]
+            column_type = column_value_types.get(column_index)
+            if column_type is None:
+                column_type, column_name = strings[column_index].split("_column:", 1)
+                column_types[column_name].add(column_type)
+                column_value_types[column_index] = column_type
+            if cell_is_none[cell_index]:
+                cell_value = None
+            elif column_type == "date":
+                date_index = 3 * cell_index
+                cell_value = Date(*cell_dates[date_index:date_index + 3])
+            elif column_type in ["number", "num2"]:
+                cell_value = cell_numbers[cell_index]
+            else:
+                cell_value = strings[cell_strings[cell_index]]
+            row[strings[column_index]] = cell_value
+        table_data.append(row)
+    return TableQuestionContext(table_data, column_types, question_tokens, table_id)
+
+
+def _read_array(data: memoryview, offset: int, typecode: str, length: int) -> Tuple[list, int]:
+    """
+    Reads ``length`` little-endian values of the given ``array`` typecode from ``data``, starting
+    at ``offset``, and returns them with the offset after them.
+    """
+    values = array.array(typecode)
+    end = offset + length * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tolist(), end
+
+
+def get_binary_table_filename(filename: str) -> str:
+    """
+    Returns the name of the binary file we write a tagged table file to, next to the tagged file.
+    """
+    return f"{filename}{BINARY_TABLE_EXTENSION}"
+
+
+def find_binary_table_file(filename: str) -> Optional[str]:
+    """
+    Returns the binary version of the given tagged table file if one exists and is not older than
+    the tagged file, and ``None`` otherwise.
+    """
+    binary_filename = get_binary_table_filename(filename)
+    try:
+        if os.path.getmtime(binary_filename) >= os.path.getmtime(filename):
+            return binary_filename
+    except OSError:
+        pass
+    return None
@@ -1,7 +1,13 @@
 import re
+import os
+import sys
+import copy
 import csv
-from typing import Union, Dict, List, Tuple, Set
+import hashlib
+from functools import lru_cache
+from typing import Union, Dict, List, Tuple, Set, Optional, Iterable
 from collections import defaultdict
+from collections.abc import Mapping
 
 from unidecode import unidecode
 from allennlp.data.tokenizers import Token
@@ -75,26 +81,105 @@ NUMBER_WORDS = {
         **MONTH_NUMBERS,
         }
 
+# The character level rules used by ``TableQuestionContext.normalize_string``. None of the characters
+# these rules produce are affected by any of the other rules, so all of them can be applied together
+# in a single ``str.translate``.
+_CHARACTER_NORMALIZATION_TABLE = str.maketrans({
+        "‚": ",",
+        "„": ",,",
+        **{character: "." for character in "·・"},
+        "…": "...",
+        "ˆ": "^",
+        "˜": "~",
+        "‹": "<",
+        "›": ">",
+        **{character: "'" for character in "‘’´`"},
+        **{character: "\"" for character in "“”«»"},
+        **{character: None for character in "•†‡²³"},
+        **{character: "-" for character in "‐‑–—−"},
+        **{character: "_" for character in "ðø′″€⁄ªΣ"},
+        })
+_STRIPPED_UNICODE_BLOCKS_REGEX = re.compile("[\\u0180-\\u0210\\u0220-\\uFFFF]+")
+# Whitespace and all other non-word characters become underscores, and consecutive underscores are
+# merged.
+_NON_WORD_CHARACTERS_REGEX = re.compile("[\\W_]+")
+
+
+# Separates the cell values we join together to search for substrings in a whole column at once.
+_CELL_SEPARATOR = "\0"
+
+
+# To make comparisons cheap, each ``Date`` is also packed into a single integer key with 16 bits
+# for the day, 16 for the month, and the year above those. Wildcard (-1) fields are stored as zero
+# in the key, and are tracked with a bit mask that says which bit ranges of the key to ignore.
+_DATE_FIELD_BITS = 16
+_DATE_FIELD_LIMIT = 1 << _DATE_FIELD_BITS
+_DAY_BITS = _DATE_FIELD_LIMIT - 1
+_MONTH_BITS = _DAY_BITS << _DATE_FIELD_BITS
+_YEAR_BITS = -1 << (2 * _DATE_FIELD_BITS)  # All the bits above the month.
+
 
 class Date:
+    # We make a lot of these when reading tables, so we use slots to keep them small. Dates are
+    # immutable, since the packed key and the hash are computed from the fields once.
+    __slots__ = ("_year", "_month", "_day", "_key", "_wildcard_bits", "_hash")
+
     def __init__(self, year: int, month: int, day: int) -> None:
-        self.year = year
-        self.month = month
-        self.day = day
+        self._year = year
+        self._month = month
+        self._day = day
+        self._hash: int = None
+        # ``_key`` is None if one of the fields cannot be packed (e.g. a negative year other than
+        # -1). We fall back to comparing the fields one by one in that case.
+        self._key: int = None
+        self._wildcard_bits = 0
+        if year >= -1 and -1 <= month < _DATE_FIELD_LIMIT and -1 <= day < _DATE_FIELD_LIMIT:
+            key = 0
+            if year == -1:
+                self._wildcard_bits |= _YEAR_BITS
+            else:
+                key |= year << (2 * _DATE_FIELD_BITS)
+            if month == -1:
+                self._wildcard_bits |= _MONTH_BITS
+            else:
+                key |= month << _DATE_FIELD_BITS
+            if day == -1:
+                self._wildcard_bits |= _DAY_BITS
+            else:
+                key |= day
+            self._key = key
+
+    @property
+    def year(self) -> int:
+        return self._year
+
+    @property
+    def month(self) -> int:
+        return self._month
+
+    @property
+    def day(self) -> int:
+        return self._day
 
     def __eq__(self, other) -> bool:
+        # pylint: disable=protected-access
         # Note that the logic below renders equality to be non-transitive. That is,
         # Date(2018, -1, -1) == Date(2018, 2, 3) and Date(2018, -1, -1) == Date(2018, 4, 5)
         # but Date(2018, 2, 3) != Date(2018, 4, 5).
         if not isinstance(other, Date):
             return False
+        if self._key is not None and other._key is not None:
+            # The dates are equal if the keys agree on all the fields that are not wildcards in
+            # either of them.
+            ignored_bits = self._wildcard_bits | other._wildcard_bits
+            return (self._key ^ other._key) & ~ignored_bits == 0
         year_is_same = self.year == -1 or other.year == -1 or self.year == other.year
         month_is_same = self.month == -1 or other.month == -1 or self.month == other.month
         day_is_same = self.day == -1 or other.day == -1 or self.day == other.day
         return year_is_same and month_is_same and day_is_same
 
     def __gt__(self, other) -> bool:
-        # pylint: disable=too-many-return-statements
+        # pylint: disable=too-many-return-statements,protected-access
         # The logic below is tricky, and is based on some assumptions we make about date comparison.
         # Year, month or day being -1 means that we do not know its value. In those cases, the
         # we consider the comparison to be undefined, and return False if all the fields that are
@@ -107,6 +192,19 @@ class Date:
         # We're doing an exclusive or below.
         if (self.year == -1) != (other.year == -1):
             return False  # comparison undefined
+        if self._key is not None and other._key is not None:
+            # The comparison is decided by the fields that are more significant than the first
+            # field that is a wildcard in either date. Since wildcard years are zero in both keys,
+            # they compare as equal, which is what we want. If the significant fields are all
+            # equal, the comparison is undefined, and ">" gives us False as required.
+            ignored_bits = self._wildcard_bits | other._wildcard_bits
+            if ignored_bits & _MONTH_BITS:
+                shift = 2 * _DATE_FIELD_BITS
+            elif ignored_bits & _DAY_BITS:
+                shift = _DATE_FIELD_BITS
+            else:
+                shift = 0
+            return (self._key >> shift) > (other._key >> shift)
         # If both years are -1, we proceed.
         if self.year != other.year:
             return self.year > other.year
@@ -133,7 +231,13 @@ class Date:
         return f"{self.year}-{self.month}-{self.day}"
 
     def __hash__(self):
-        return hash(str(self))
+        if self._hash is None:
+            self._hash = hash(str(self))
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash is only valid within a process, so we do not pickle it.
+        return (Date, (self.year, self.month, self.day))
 
     @classmethod
     def make_date(cls, string: str) -> 'Date':
@@ -156,6 +260,79 @@ class Date:
         return Date(year, month, day)
 
 CellValueType = Union[str, float, Date]
+# The string entities in a question, with the columns they occur in, and the numbers in a question,
+# with the indices of the tokens they come from. See ``TableQuestionContext.get_entities_from_question``.
+QuestionEntitiesType = Tuple[List[Tuple[str, List[str]]], List[Tuple[str, int]]]
+
+
+class TableRow(Mapping):
+    """
+    A compact, read-only row of a table, which can be used wherever a row dict is read. The values
+    are stored in a tuple, and the positions of the columns in it are in a dict shared by all the
+    rows with the same columns, so a row costs two pointers and a tuple instead of a full dict.
+    Looking up a value is a little slower than with a dict, so this is only worth it when many
+    tables are kept in memory. See ``TableQuestionContext.compact_table_data``.
+    """
+    __slots__ = ("_column_indices", "_values")
+
+    def __init__(self, column_indices: Dict[str, int], values: Tuple[CellValueType, ...]) -> None:
+        self._column_indices = column_indices
+        self._values = values
+
+    def __getitem__(self, column_name: str) -> CellValueType:
+        return self._values[self._column_indices[column_name]]
+
+    def __iter__(self):
+        return iter(self._column_indices)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self):
+        return f"TableRow({dict(self.items())})"
+
+    def __getstate__(self):
+        return (self._column_indices, self._values)
+
+    def __setstate__(self, state):
+        self._column_indices, self._values = state
+
+
+class QuestionTokenTags:
+    """
+    What ``TableQuestionContext.tag_token`` recognizes in a question token.
+
+    Parameters
+    ----------
+    number : ``Union[int, float]``
+        The number the token expresses, if any, before scaling by a following order of magnitude
+        word.
+    number_has_decimal_point : ``bool``
+        Whether the digits in the token include a decimal point, in which case we output the number
+        with three decimal places.
+    range_size : ``int``
+        If the token is a range like "1950s", the size of the range (10 here).
+    magnitude : ``int``
+        If the token is an order of magnitude word like "thousand", the value it scales numbers by.
+    is_month : ``bool``
+    is_year : ``bool``
+        Whether the token is a four digit number between 1100 and 2100.
+    """
+    __slots__ = ("number", "number_has_decimal_point", "range_size", "magnitude", "is_month", "is_year")
+
+    def __init__(self,
+                 number: Optional[Union[int, float]],
+                 number_has_decimal_point: bool,
+                 range_size: Optional[int],
+                 magnitude: Optional[int],
+                 is_month: bool,
+                 is_year: bool) -> None:
+        self.number = number
+        self.number_has_decimal_point = number_has_decimal_point
+        self.range_size = range_size
+        self.magnitude = magnitude
+        self.is_month = is_month
+        self.is_year = is_year
 
 
 class TableQuestionContext:
@@ -163,12 +340,18 @@ class TableQuestionContext:
     A barebones implementation similar to
     https://github.com/crazydonkey200/neural-symbolic-machines/blob/master/table/wtq/preprocess.py
     for extracting entities from a question given a table and type its columns with <string> | <date> | <number>
+
+    ``table_id`` identifies the table the context was read from (the file path and modification
+    time, or a hash of the table content), so that per-table structures can be shared across all
+    the questions asked about the same table. If it is ``None``, nothing is shared.
     """
     def __init__(self,
                  table_data: List[Dict[str, CellValueType]],
                  column_types: Dict[str, Set[str]],
-                 question_tokens: List[Token]) -> None:
+                 question_tokens: List[Token],
+                 table_id: str = None) -> None:
         self.table_data = table_data
+        self.table_id = table_id
         self.column_types: Set[str] = set()
         for types in column_types.values():
             self.column_types.update(types)
@@ -182,20 +365,117 @@ class TableQuestionContext:
         # We want the object to raise KeyError when checking if a specific string is a cell in the
         # table.
         self._string_column_mapping = dict(string_column_mapping)
+        # All the strings under each column, joined into one string so that we can find the columns
+        # containing a substring with one search per column. Built lazily by
+        # ``_get_column_cell_strings``.
+        self._column_cell_strings: Dict[str, str] = None
+        self._question_token_tags: List[QuestionTokenTags] = None
+        self._question_entities_and_numbers: QuestionEntitiesType = None
         self._table_knowledge_graph: KnowledgeGraph = None
+        # The part of the knowledge graph that does not depend on the question. Built lazily by
+        # ``_get_column_knowledge_graph``.
+        self._column_knowledge_graph: Tuple[Set[str], Dict[str, List[str]], Dict[str, str], List[str]] = None
 
     def __eq__(self, other):
         if not isinstance(other, TableQuestionContext):
             return False
         return self.table_data == other.table_data
 
+    def __getstate__(self):
+        # The joined column strings and the knowledge graph are large, and quick to build again.
+        state = self.__dict__.copy()
+        state["_column_cell_strings"] = None
+        state["_table_knowledge_graph"] = None
+        return state
+
+    def with_question(self,
+                      question_tokens: List[Token],
+                      question_entities_and_numbers: QuestionEntitiesType = None,
+                      table_knowledge_graph: KnowledgeGraph = None) -> 'TableQuestionContext':
+        """
+        Returns a context for a different question about the same table. Everything that depends
+        only on the table (the rows, column types, and the mappings we use to find question
+        entities in the table) is shared with this context, and only the question entities and
+        numbers and the knowledge graph are computed again, unless they are given as
+        ``question_entities_and_numbers`` (in the form ``get_entities_from_question`` returns them)
+        and ``table_knowledge_graph``.
+        """
+        # We build the joined column strings and the column part of the knowledge graph here if we
+        # have not yet, so that all the contexts made from this one share them.
+        self._get_column_cell_strings()
+        self._get_column_knowledge_graph()
+        context = copy.copy(self)
+        context.question_tokens = question_tokens
+        context._question_token_tags = None  # pylint: disable=protected-access
+        context._question_entities_and_numbers = question_entities_and_numbers  # pylint: disable=protected-access
+        context._table_knowledge_graph = table_knowledge_graph  # pylint: disable=protected-access
+        return context
+
+    def compact_table_data(self) -> 'TableQuestionContext':
+        """
+        Replaces the row dicts in ``table_data`` with ``TableRows``, which take much less memory,
+        and are read in the same way. Rows with the same columns share their column schema. This
+        is meant for readers that keep whole datasets in memory. Returns the context itself.
+        """
+        if all(isinstance(row, TableRow) for row in self.table_data):
+            return self
+        schemas: Dict[Tuple[str, ...], Dict[str, int]] = {}
+        compact_table_data: List[TableRow] = []
+        for row in self.table_data:
+            if isinstance(row, TableRow):
+                compact_table_data.append(row)
+                continue
+            column_names = tuple(row.keys())
+            if column_names not in schemas:
+                schemas[column_names] = {column_name: index for index, column_name in enumerate(column_names)}
+            compact_table_data.append(TableRow(schemas[column_names], tuple(row.values())))
+        self.table_data = compact_table_data
+        return self
+
     def get_table_knowledge_graph(self) -> KnowledgeGraph:
         if self._table_knowledge_graph is None:
+            column_entities, column_neighbors, column_entity_text, number_and_date_columns = \
+                    self._get_column_knowledge_graph()
+            string_entities, numbers = self.get_entities_from_question()
+            if not string_entities and not numbers:
+                self._table_knowledge_graph = KnowledgeGraph(column_entities, column_neighbors, column_entity_text)
+                return self._table_knowledge_graph
+            # We only copy the neighbors of the entities the question adds, and of the columns they
+            # are linked to. Everything else is shared with the column graph.
+            added_neighbors: Dict[str, List[str]] = defaultdict(list)
+            entity_text = dict(column_entity_text)
+            for entity, column_names in string_entities:
+                for column_name in column_names:
+                    added_neighbors[entity].append(column_name)
+                    added_neighbors[column_name].append(entity)
+                entity_text[entity] = entity.replace("string:", "").replace("_", " ")
+            # For all numbers (except -1), we add all number and date columns as their neighbors.
+            for number, _ in numbers:
+                added_neighbors[number].extend(number_and_date_columns)
+                for column_name in number_and_date_columns:
+                    added_neighbors[column_name].append(number)
+                entity_text[number] = number
+            neighbors = dict(column_neighbors)
+            for entity, entity_neighbors in added_neighbors.items():
+                neighbors[entity] = list(set(column_neighbors.get(entity, []) + entity_neighbors))
+            self._table_knowledge_graph = KnowledgeGraph(column_entities.union(added_neighbors),
+                                                         neighbors,
+                                                         entity_text)
+        return self._table_knowledge_graph
+
+    def _get_column_knowledge_graph(self) -> Tuple[Set[str], Dict[str, List[str]], Dict[str, str], List[str]]:
+        """
+        Returns the entities, neighbors and entity text of the part of the knowledge graph that
+        does not depend on the question, and the number and date columns that question numbers
+        are linked to. The graphs of all the contexts made with ``with_question`` share these, so
+        they must not be modified.
+        """
+        if self._column_knowledge_graph is None:
+            # Add all column names to entities. We'll define their neighbors to be empty lists for
+            # now, and the question adds number and string entities as needed.
             entities: Set[str] = set()
-            neighbors: Dict[str, List[str]] = defaultdict(list)
+            neighbors: Dict[str, List[str]] = {}
             entity_text: Dict[str, str] = {}
-            # Add all column names to entities. We'll define their neighbors to be empty lists for
-            # now, and later add number and string entities as needed.
             number_columns = []
             date_columns = []
             for typed_column_name in self.table_data[0].keys():
@@ -205,124 +485,171 @@ class TableQuestionContext:
                 if "date_column:" in typed_column_name:
                     date_columns.append(typed_column_name)
 
-                # Add column names to entities, with no neighbors yet.
                 entities.add(typed_column_name)
                 neighbors[typed_column_name] = []
                 entity_text[typed_column_name] = typed_column_name.split(":")[-1].replace("_", " ")
 
-            string_entities, numbers = self.get_entities_from_question()
-            for entity, column_names in string_entities:
-                entities.add(entity)
-                for column_name in column_names:
-                    neighbors[entity].append(column_name)
-                    neighbors[column_name].append(entity)
-                entity_text[entity] = entity.replace("string:", "").replace("_", " ")
-            # For all numbers (except -1), we add all number and date columns as their neighbors.
-            for number, _ in numbers:
-                entities.add(number)
-                neighbors[number].extend(number_columns + date_columns)
-                for column_name in number_columns + date_columns:
-                    neighbors[column_name].append(number)
-                entity_text[number] = number
-            for entity, entity_neighbors in neighbors.items():
-                neighbors[entity] = list(set(entity_neighbors))
-
             # Add "-1" as an entity only if we have date columns in the table because we will need
-            # it as a wild-card in dates. The neighbors are the date columns.
-            if "-1" not in neighbors and date_columns:
+            # it as a wild-card in dates. The neighbors are the date columns. If the question has
+            # -1 as a number, it is linked to the number columns too.
+            if date_columns:
                 entities.add("-1")
-                neighbors["-1"] = date_columns
+                neighbors["-1"] = list(date_columns)
                 entity_text["-1"] = "-1"
                 for date_column in date_columns:
                     neighbors[date_column].append("-1")
-            self._table_knowledge_graph = KnowledgeGraph(entities, dict(neighbors), entity_text)
-        return self._table_knowledge_graph
+            self._column_knowledge_graph = (entities, neighbors, entity_text, number_columns + date_columns)
+        return self._column_knowledge_graph
 
     @classmethod
     def read_from_lines(cls,
-                        lines: List[List[str]],
-                        question_tokens: List[Token]) -> 'TableQuestionContext':
-        column_index_to_name = {}
+                        lines: Iterable[List[str]],
+                        question_tokens: List[Token],
+                        table_id: str = None,
+                        identify_by_content: bool = False) -> 'TableQuestionContext':
+        """
+        Reads a table from the lines of a CoreNLP tagged file, split into fields. We process the
+        lines as they come in, so ``lines`` can be any iterable, like a ``csv.reader``. If
+        ``table_id`` is not given and ``identify_by_content`` is set, we compute it from the
+        content of the lines (see ``get_table_id_from_lines``) as we read them. Otherwise the table
+        has no id, and nothing is shared with other contexts on the same table.
+        """
+        line_iterator = iter(lines)
+        content_hash = hashlib.md5() if table_id is None and identify_by_content else None
+        header = next(line_iterator) # the first line is the header
+        if content_hash is not None:
+            content_hash.update("\t".join(header).encode("utf-8"))
+            content_hash.update(b"\n")
+        # We look up the positions of the fields we need once, instead of making a dict per cell.
+        row_field = header.index('row')
+        column_field = header.index('col')
+        # The order of these fields is the order in which we add column types. "string" comes from
+        # the "content" field.
+        cell_value_fields = [header.index(field) for field in ['date', 'number', 'num2', 'content']]
+        cell_value_types = ['date', 'number', 'num2', 'string']
+        cell_value_type_indices = {value_type: index for index, value_type in enumerate(cell_value_types)}
 
-        header = lines[0] # the first line is the header
-        index = 1
-        # Each row is a mapping from column names to cell data. Cell data is a dict, where keys are
-        # "string", "number", "num2" and "date", and the values are the corresponding values
-        # extracted by CoreNLP.
-        table_data: List[Dict[str, Dict[str, str]]] = []
-        while lines[index][0] == '-1':
-            # column names start with fb:row.row.
-            current_line = lines[index]
-            column_name_sempre = current_line[2]
-            column_index = int(current_line[1])
-            column_name = column_name_sempre.replace('fb:row.row.', '')
-            column_index_to_name[column_index] = column_name
-            index += 1
+        column_index_to_name = {}
         column_types: Dict[str, Set[str]] = defaultdict(set)
+        # The cells in the order they are listed, each with the index of its row, its column name,
+        # and the date, number, num2 and string values extracted by CoreNLP, in that order, or None
+        # for the values that are missing.
+        cells: List[Tuple[int, str, Tuple[Optional[str], ...]]] = []
+        reading_column_names = True
+        num_rows = 0
         last_row_index = -1
-        for current_line in lines[1:]:
-            row_index = int(current_line[0])
+        for current_line in line_iterator:
+            if content_hash is not None:
+                content_hash.update("\t".join(current_line).encode("utf-8"))
+                content_hash.update(b"\n")
+            if reading_column_names and current_line[0] == '-1':
+                # Column names start with fb:row.row., and they are all listed before the cells.
+                column_name_sempre = current_line[2]
+                column_index = int(current_line[column_field])
+                column_name = column_name_sempre.replace('fb:row.row.', '')
+                column_index_to_name[column_index] = column_name
+                continue
+            reading_column_names = False
+            row_index = int(current_line[row_field])
             if row_index == -1:
                 continue  # header row
-            column_index = int(current_line[1])
+            column_index = int(current_line[column_field])
             if row_index != last_row_index:
-                table_data.append({})
-            node_info = dict(zip(header, current_line))
-            cell_data: Dict[str, str] = {}
+                num_rows += 1
             column_name = column_index_to_name[column_index]
-            if node_info['date']:
-                column_types[column_name].add("date")
-                cell_data["date"] = node_info["date"]
-
-            if node_info['number']:
-                column_types[column_name].add("number")
-                cell_data["number"] = node_info["number"]
-
-            if node_info['num2']:
-                column_types[column_name].add("num2")
-                cell_data["num2"] = node_info["num2"]
-
-            if node_info['content'] != '—':
-                column_types[column_name].add("string")
-                cell_data['string'] = node_info["content"]
-
-            table_data[-1][column_name] = cell_data
+            date, number, num2, content = [current_line[field] for field in cell_value_fields]
+            cell_data = (date or None, number or None, num2 or None, content if content != '—' else None)
+            for value_type, cell_value_string in zip(cell_value_types, cell_data):
+                if cell_value_string is not None:
+                    column_types[column_name].add(value_type)
+            cells.append((num_rows - 1, column_name, cell_data))
             last_row_index = row_index
+        if content_hash is not None:
+            table_id = content_hash.hexdigest()
         # Table data with each column split into different ones, depending on the types they have.
-        table_data_with_column_types: List[Dict[str, CellValueType]] = []
-        for table_row in table_data:
-            table_data_with_column_types.append({})
-            for column_name, cell_data in table_row.items():
-                for column_type in column_types[column_name]:
-                    typed_column_name = f"{column_type}_column:{column_name}"
-                    cell_value_string = cell_data.get(column_type, None)
-                    if column_type in ["number", "num2"]:
-                        try:
-                            cell_number = float(cell_value_string)
-                        except (ValueError, TypeError):
-                            cell_number = None
-                        table_data_with_column_types[-1][typed_column_name] = cell_number
-                    elif column_type == "date":
-                        cell_date = None
-                        if cell_value_string is not None:
-                            cell_date = Date.make_date(cell_value_string)
-                        table_data_with_column_types[-1][typed_column_name] = cell_date
+        # A cell in a later row can add a type to a column, so we can only convert the cells once we
+        # have seen all of them. Typed column names are interned, so that all the tables with a
+        # column share one copy of its name.
+        typed_column_names = {column_name: [(sys.intern(f"{column_type}_column:{column_name}"),
+                                             column_type,
+                                             cell_value_type_indices[column_type])
+                                            for column_type in types]
+                              for column_name, types in column_types.items()}
+        table_data: List[Dict[str, CellValueType]] = [{} for _ in range(num_rows)]
+        for row_index, column_name, cell_data in cells:
+            typed_row = table_data[row_index]
+            for typed_column_name, column_type, value_index in typed_column_names[column_name]:
+                cell_value_string = cell_data[value_index]
+                if column_type in ["number", "num2"]:
+                    try:
+                        cell_number = float(cell_value_string)
+                    except (ValueError, TypeError):
+                        cell_number = None
+                    typed_row[typed_column_name] = cell_number
+                elif column_type == "date":
+                    cell_date = None
+                    if cell_value_string is not None:
+                        cell_date = Date.make_date(cell_value_string)
+                    typed_row[typed_column_name] = cell_date
+                else:
+                    if cell_value_string is None:
+                        normalized_string = None
                     else:
-                        if cell_value_string is None:
-                            normalized_string = None
-                        else:
-                            normalized_string = cls.normalize_string(cell_value_string)
-                        table_data_with_column_types[-1][typed_column_name] = normalized_string
-        return cls(table_data_with_column_types, column_types, question_tokens)
+                        normalized_string = cls.normalize_string(cell_value_string)
+                    typed_row[typed_column_name] = normalized_string
+        return cls(table_data, column_types, question_tokens, table_id)
 
     @classmethod
     def read_from_file(cls, filename: str, question_tokens: List[Token]) -> 'TableQuestionContext':
+        """
+        Reads a table from a CoreNLP tagged file. See ``table_io.read_from_file`` to also read the
+        pre-parsed binary files.
+        """
         with open(filename, 'r') as file_pointer:
             reader = csv.reader(file_pointer, delimiter='\t', quoting=csv.QUOTE_NONE)
-            lines = [line for line in reader]
-            return cls.read_from_lines(lines, question_tokens)
+            return cls.read_from_lines(reader, question_tokens, cls.get_table_id_from_file(filename))
+
+    @staticmethod
+    def get_table_id_from_file(filename: str) -> str:
+        """
+        Identifies a table file by its absolute path and modification time, so that a table that
+        is rewritten on disk gets a new id.
+        """
+        return f"{os.path.abspath(filename)}:{os.path.getmtime(filename)}"
 
-    def get_entities_from_question(self) -> Tuple[List[Tuple[str, str]], List[Tuple[str, int]]]:
+    @staticmethod
+    def get_table_file_from_id(table_id: str) -> Optional[str]:
+        """
+        Returns the file a table was read from, given its id (see ``get_table_id_from_file``), if
+        the file has not changed since, and ``None`` otherwise.
+        """
+        filename, _, _ = table_id.rpartition(":")
+        try:
+            if filename and TableQuestionContext.get_table_id_from_file(filename) == table_id:
+                return filename
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def get_table_id_from_lines(lines: List[List[str]]) -> str:
+        """
+        Identifies a table given as lines (as read by the dataset reader) by a hash of its content.
+        """
+        content_hash = hashlib.md5()
+        for line in lines:
+            content_hash.update("\t".join(line).encode("utf-8"))
+            content_hash.update(b"\n")
+        return content_hash.hexdigest()
+
+    def get_entities_from_question(self) -> QuestionEntitiesType:
+        """
+        Returns the string entities in the question, with the columns they occur in, and the
+        numbers in the question, with the indices of the tokens they come from. These are computed
+        once per context, since both the knowledge graph and the world need them.
+        """
+        if self._question_entities_and_numbers is not None:
+            return self._question_entities_and_numbers
         entity_data = []
         for i, token in enumerate(self.question_tokens):
             token_text = token.text
@@ -340,73 +667,103 @@ class TableQuestionContext:
                                     'token_type': token_type,
                                     'token_in_columns': token_columns})
 
-        extracted_numbers = self._get_numbers_from_tokens(self.question_tokens)
+        extracted_numbers = self._get_numbers_from_token_tags(self.get_question_token_tags())
         # filter out number entities to avoid repetition
         expanded_entities = []
         for entity in self._expand_entities(self.question_tokens, entity_data):
             if entity["token_type"] == "string":
-                expanded_entities.append((f"string:{entity['value']}", entity['token_in_columns']))
-        return expanded_entities, extracted_numbers  #TODO(shikhar) Handle conjunctions
+                expanded_entities.append((sys.intern(f"string:{entity['value']}"), entity['token_in_columns']))
+        #TODO(shikhar) Handle conjunctions
+        self._question_entities_and_numbers = (expanded_entities, extracted_numbers)
+        return self._question_entities_and_numbers
+
+    def get_question_token_tags(self) -> List[QuestionTokenTags]:
+        """
+        Returns the ``QuestionTokenTags`` of each question token (see ``tag_token``). These are
+        computed once per context, and used both for extracting numbers from the question and by
+        the world for building agendas.
+        """
+        if self._question_token_tags is None:
+            self._question_token_tags = [self.tag_token(token.text) for token in self.question_tokens]
+        return self._question_token_tags
 
     @staticmethod
-    def _get_numbers_from_tokens(tokens: List[Token]) -> List[Tuple[str, int]]:
+    @lru_cache(maxsize=100000)
+    def tag_token(token_text: str) -> QuestionTokenTags:
+        """
+        Recognizes numbers, ranges, months and years in the text of a question token. We do some
+        simple heuristic number recognition, finding ordinals and cardinals expressed as text
+        ("one", "first", etc.), as well as numerals ("7th", "3rd"), months (mapping "july" to 7),
+        and units ("1ghz").
+
+        We also handle year ranges expressed as decade or centuries ("1800s" or "1950s"), recording
+        the size of the range so that we can add its endpoints as possible numbers to generate.
+
+        The same words occur in many questions, so the tags are cached by token text, and must not
+        be modified.
         """
-        Finds numbers in the input tokens and returns them as strings.  We do some simple heuristic
-        number recognition, finding ordinals and cardinals expressed as text ("one", "first",
-        etc.), as well as numerals ("7th", "3rd"), months (mapping "july" to 7), and units
-        ("1ghz").
+        text = token_text.replace(',', '').lower()
+        number = NUMBER_WORDS.get(text, None)
+        magnitude = ORDER_OF_MAGNITUDE_WORDS.get(token_text.lower(), None)
+
+        is_range = False
+        if len(text) > 1 and text[-1] == 's' and text[-2] == '0':
+            is_range = True
+            text = text[:-1]
+
+        # We strip out any non-digit characters, to capture things like '7th', or '1ghz'.  The
+        # way we're doing this could lead to false positives for something like '1e2', but
+        # we'll take that risk.  It shouldn't be a big deal.
+        text = ''.join(char for char in text if char in NUMBER_CHARACTERS)
+
+        try:
+            # We'll use a check for float(text) to find numbers, because text.isdigit() doesn't
+            # catch things like "-3" or "0.07".
+            number = float(text)
+        except ValueError:
+            pass
 
-        We also handle year ranges expressed as decade or centuries ("1800s" or "1950s"), adding
-        the endpoints of the range as possible numbers to generate.
+        range_size = None
+        if number is not None and is_range:
+            num_zeros = 1
+            # Tokens like "00s" are all zeros, so we stop at the start of the text.
+            while num_zeros < len(text) and text[-(num_zeros + 1)] == '0':
+                num_zeros += 1
+            range_size = 10 ** num_zeros
+        is_month = token_text in MONTH_NUMBERS
+        is_year = (token_text.isdigit() and len(token_text) == 4 and
+                   int(token_text) < 2100 and int(token_text) > 1100)
+        return QuestionTokenTags(number, '.' in text, range_size, magnitude, is_month, is_year)
+
+    @staticmethod
+    def _get_numbers_from_token_tags(token_tags: List[QuestionTokenTags]) -> List[Tuple[str, int]]:
+        """
+        Finds numbers in the tagged question tokens and returns them as strings. A number followed
+        by an order of magnitude word ("hundred", "thousand", ...) is scaled by it, and for ranges
+        we add both endpoints.
 
         We return a list of tuples, where each tuple is the (number_string, token_index) for a
         number found in the input tokens.
         """
         numbers = []
-        for i, token in enumerate(tokens):
-            token_text = token.text
-            text = token.text.replace(',', '').lower()
-            number = NUMBER_WORDS.get(text, None)
-
+        for i, tags in enumerate(token_tags):
+            if tags.number is None:
+                continue
             magnitude = 1
-            if i < len(tokens) - 1:
-                next_token = tokens[i + 1].text.lower()
-                if next_token in ORDER_OF_MAGNITUDE_WORDS:
-                    magnitude = ORDER_OF_MAGNITUDE_WORDS[next_token]
-                    token_text += ' ' + tokens[i + 1].text
-
-            is_range = False
-            if len(text) > 1 and text[-1] == 's' and text[-2] == '0':
-                is_range = True
-                text = text[:-1]
-
-            # We strip out any non-digit characters, to capture things like '7th', or '1ghz'.  The
-            # way we're doing this could lead to false positives for something like '1e2', but
-            # we'll take that risk.  It shouldn't be a big deal.
-            text = ''.join(text[i] for i, char in enumerate(text) if char in NUMBER_CHARACTERS)
-
-            try:
-                # We'll use a check for float(text) to find numbers, because text.isdigit() doesn't
-                # catch things like "-3" or "0.07".
-                number = float(text)
-            except ValueError:
-                pass
-
-            if number is not None:
-                number = number * magnitude
-                if '.' in text:
-                    number_string = '%.3f' % number
-                else:
-                    number_string = '%d' % number
-                numbers.append((number_string, i))
-                if is_range:
-                    # TODO(mattg): both numbers in the range will have the same text, and so the
-                    # linking score won't have any way to differentiate them...  We should figure
-                    # out a better way to handle this.
-                    num_zeros = 1
-                    while text[-(num_zeros + 1)] == '0':
-                        num_zeros += 1
-                    numbers.append((str(int(number + 10 ** num_zeros)), i))
+            if i < len(token_tags) - 1 and token_tags[i + 1].magnitude is not None:
+                magnitude = token_tags[i + 1].magnitude
+
+            number = tags.number * magnitude
+            if tags.number_has_decimal_point:
+                number_string = '%.3f' % number
+            else:
+                number_string = '%d' % number
+            numbers.append((number_string, i))
+            if tags.range_size is not None:
+                # TODO(mattg): both numbers in the range will have the same text, and so the
+                # linking score won't have any way to differentiate them...  We should figure
+                # out a better way to handle this.
+                numbers.append((str(int(number + tags.range_size)), i))
         return numbers
 
     def _string_in_table(self, candidate: str) -> List[str]:
@@ -420,12 +777,35 @@ class TableQuestionContext:
             candidate_column_names = self._string_column_mapping[candidate]
         # If not, check if it is a substring pf any cell value.
         if not candidate_column_names:
-            for cell_value, column_names in self._string_column_mapping.items():
-                if candidate in cell_value:
-                    candidate_column_names.extend(column_names)
+            column_cell_strings = self._get_column_cell_strings()
+            if column_cell_strings is not None and _CELL_SEPARATOR not in candidate:
+                candidate_column_names = [column_name for column_name, cell_strings in
+                                          column_cell_strings.items() if candidate in cell_strings]
+            else:
+                for cell_value, column_names in self._string_column_mapping.items():
+                    if candidate in cell_value:
+                        candidate_column_names.extend(column_names)
         candidate_column_names = list(set(candidate_column_names))
         return candidate_column_names
 
+    def _get_column_cell_strings(self) -> Optional[Dict[str, str]]:
+        """
+        Returns a mapping from each string column to all the distinct cell values under it, joined
+        by ``_CELL_SEPARATOR``. A substring occurs in a cell under a column iff it occurs in the
+        joined string, as long as it does not contain the separator. Returns ``None`` if some cell
+        contains the separator (which normalized strings should never do).
+        """
+        if self._column_cell_strings is None:
+            column_cell_values: Dict[str, List[str]] = defaultdict(list)
+            for cell_value, column_names in self._string_column_mapping.items():
+                if _CELL_SEPARATOR in cell_value:
+                    return None
+                for column_name in set(column_names):
+                    column_cell_values[column_name].append(cell_value)
+            self._column_cell_strings = {column_name: _CELL_SEPARATOR.join(cell_values)
+                                         for column_name, cell_values in column_cell_values.items()}
+        return self._column_cell_strings
+
     def _process_conjunction(self, entity_data):
         raise NotImplementedError
 
@@ -467,6 +847,7 @@ class TableQuestionContext:
         return new_entities
 
     @staticmethod
+    @lru_cache(maxsize=100000)
     def normalize_string(string: str) -> str:
         """
         These are the transformation rules used to normalize cell in column names in Sempre.  See
@@ -475,33 +856,18 @@ class TableQuestionContext:
         rules here to normalize and canonicalize cells and columns in the same way so that we can
         match them against constants in logical forms appropriately.
         """
-        # Normalization rules from Sempre
-        # \u201A -> ,
-        string = re.sub("‚", ",", string)
-        string = re.sub("„", ",,", string)
-        string = re.sub("[·・]", ".", string)
-        string = re.sub("…", "...", string)
-        string = re.sub("ˆ", "^", string)
-        string = re.sub("˜", "~", string)
-        string = re.sub("‹", "<", string)
-        string = re.sub("›", ">", string)
-        string = re.sub("[‘’´`]", "'", string)
-        string = re.sub("[“”«»]", "\"", string)
-        string = re.sub("[•†‡²³]", "", string)
-        string = re.sub("[‐‑–—−]", "-", string)
-        # Oddly, some unicode characters get converted to _ instead of being stripped.  Not really
-        # sure how sempre decides what to do with these...  TODO(mattg): can we just get rid of the
-        # need for this function somehow?  It's causing a whole lot of headaches.
-        string = re.sub("[ðø′″€⁄ªΣ]", "_", string)
+        # Normalization rules from Sempre, applied in a single pass.
+        string = string.translate(_CHARACTER_NORMALIZATION_TABLE)
         # This is such a mess.  There isn't just a block of unicode that we can strip out, because
         # sometimes sempre just strips diacritics...  We'll try stripping out a few separate
-        # blocks, skipping the ones that sempre skips...
-        string = re.sub("[\\u0180-\\u0210]", "", string).strip()
-        string = re.sub("[\\u0220-\\uFFFF]", "", string).strip()
+        # blocks, skipping the ones that sempre skips...  Some characters also get converted to _
+        # instead of being stripped (see the translation table above).
+        string = _STRIPPED_UNICODE_BLOCKS_REGEX.sub("", string).strip()
         string = string.replace("\\n", "_")
-        string = re.sub("\\s+", " ", string)
         # Canonicalization rules from Sempre.
-        string = re.sub("[^\\w]", "_", string)
-        string = re.sub("_+", "_", string)
-        string = re.sub("_$", "", string)
-        return unidecode(string.lower())
+        string = _NON_WORD_CHARACTERS_REGEX.sub("_", string)
+        if string.endswith("_"):
+            string = string[:-1]
+        # Normalized strings are cell values and entity names that recur across many tables and
+        # questions, so we keep one copy of each in the interpreter's pool of interned strings.
+        return sys.intern(unidecode(string.lower()))
@@ -0,0 +1,126 @@
+"""
+Helpers shared by the executors: counters for the unusual situations they run into, parsing
+logical forms (optionally sharing the common sub-expressions of a batch of them), and a cache of
+executors per table.
+"""
+from typing import Callable, Dict, List, Tuple, TypeVar, Union
+from collections import defaultdict
+import logging
+
+from allennlp.semparse import util as semparse_util
+
+from weak_supervision.common import LruCache
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+NestedList = List[Union[str, List]]  # pylint: disable=invalid-name
+ExecutorType = TypeVar('ExecutorType')  # pylint: disable=invalid-name
+
+# Counts of the unusual (but not fatal) situations the executors run into, per kind. We count these
+# instead of logging each occurrence because the executors are called in the inner loops of search
+# and training. See ``get_diagnostic_counts`` and ``log_diagnostic_counts``.
+DIAGNOSTIC_COUNTS: Dict[str, int] = defaultdict(int)
+
+# Executors only read the table data, so worlds built on the same table can share one executor, and
+# with it all the per-table indexes it builds. We keep the executors for the most recently used
+# tables here, keyed by ``TableQuestionContext.table_id``.
+MAX_CACHED_EXECUTORS = 128
+_EXECUTOR_CACHE: LruCache[str, object] = LruCache(MAX_CACHED_EXECUTORS)
+
+
+def get_diagnostic_counts(reset: bool = False) -> Dict[str, int]:
+    """
+    Returns the number of times each kind of diagnostic event (like executing a logical form that
+    fails, or taking the ``first`` of an empty list) happened in this process, and optionally
+    resets the counts.
+    """
+    counts = dict(DIAGNOSTIC_COUNTS)
+    if reset:
+        DIAGNOSTIC_COUNTS.clear()
+    return counts
+
+
+def log_diagnostic_counts(reset: bool = False) -> None:
+    """
+    Logs the counts from ``get_diagnostic_counts``, one line per kind of event, and optionally
+    resets them. The ERM model calls this whenever its metrics are reset.
+    """
+    for kind, count in sorted(get_diagnostic_counts(reset).items()):
+        logger.info("Executor diagnostics: %s happened %d times", kind, count)
+
+
+def parse_logical_form(logical_form: str) -> NestedList:
+    """
+    Parses a logical form into the nested list expression the executors evaluate. The outer
+    parentheses are optional.
+    """
+    if not logical_form.startswith("("):
+        logical_form = f"({logical_form})"
+    logical_form = logical_form.replace(",", " ")
+    expression_as_list = semparse_util.lisp_to_nested_expression(logical_form)
+    # Expression list has an additional level of
+    # nesting at the top. For example, if the
+    # logical form is
+    # "(select all_rows fb:row.row.league)",
+    # the expression list will be
+    # [['select', 'all_rows', 'fb:row.row.league']].
+    # Removing the top most level of nesting.
+    return expression_as_list[0]
+
+
+def parse_shared_logical_form(logical_form: str,
+                              unique_expressions: Dict[Tuple, Tuple]) -> Union[str, Tuple, NestedList]:
+    """
+    Parses a logical form like ``parse_logical_form`` does, but
+    returns nested tuples instead of nested lists, reusing the tuple in ``unique_expressions`` for
+    every sub-expression that was seen before, so that equal sub-expressions are the same object.
+    Executors can then evaluate each of them once per batch, keyed by its id. Parsing follows
+    ``semparse_util.lisp_to_nested_expression``, but closes each expression in the same pass.
+    """
+    if not logical_form.startswith("("):
+        logical_form = f"({logical_form})"
+    logical_form = logical_form.replace(",", " ")
+    stack: List[List] = []
+    current_expression: List = []
+    for token in logical_form.split():
+        while token[0] == '(':
+            stack.append(current_expression)
+            current_expression = []
+            token = token[1:]
+        current_expression.append(token.replace(')', ''))
+        while token[-1] == ')':
+            expression = tuple(current_expression)
+            current_expression = stack.pop()
+            current_expression.append(unique_expressions.setdefault(expression, expression))
+            token = token[:-1]
+    if stack:
+        # Unbalanced parentheses. We leave it to the list-based parser to decide what this means,
+        # and do not share anything.
+        return semparse_util.lisp_to_nested_expression(logical_form)[0]
+    return current_expression[0]
+
+
+def share_expression(expression: NestedList, unique_expressions: Dict[Tuple, Tuple]) -> Union[str, Tuple]:
+    """
+    Converts a nested list expression into the nested tuples ``parse_shared_logical_form``
+    returns, reusing the tuples in ``unique_expressions``.
+    """
+    if not isinstance(expression, list):
+        return expression
+    shared_expression = tuple(share_expression(argument, unique_expressions) for argument in expression)
+    return unique_expressions.setdefault(shared_expression, shared_expression)
+
+
+def get_executor_for_table(table_id: str, make_executor: Callable[[], ExecutorType]) -> ExecutorType:
+    """
+    Returns the executor for the table with the given id, reusing the one made for an earlier
+    context on the same table if it is still cached, and calling ``make_executor`` otherwise. If
+    ``table_id`` is ``None``, the table cannot be identified, and we always make a new executor.
+    """
+    if table_id is None:
+        return make_executor()
+    return _EXECUTOR_CACHE.get_or_add(table_id, make_executor)  # type: ignore
+
+
+def clear_executor_cache() -> None:
+    _EXECUTOR_CACHE.clear()
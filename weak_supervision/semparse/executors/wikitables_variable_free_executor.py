@@ -1,20 +1,22 @@
-from typing import List, Dict, Tuple, Union, Any
+from typing import List, Dict, Tuple, Union, Any, Callable
 from collections import defaultdict
 import re
+import math
+import operator
 import logging
 from unidecode import unidecode
 
-from allennlp.semparse import util as semparse_util
 from allennlp.semparse.worlds.world import ExecutionError
 from allennlp.tools import wikitables_evaluator as evaluator
 
 from weak_supervision.semparse.contexts import TableQuestionContext
 from weak_supervision.semparse.contexts.table_question_context import (Date, CellValueType,
                                                                        MONTH_NUMBERS)
+from weak_supervision.semparse.executors.util import (DIAGNOSTIC_COUNTS, NestedList, parse_logical_form,
+                                                      parse_shared_logical_form, share_expression)
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
-NestedList = List[Union[str, List]]  # pylint: disable=invalid-name
 RowListType = List[Dict[str, CellValueType]]  # pylint: disable=invalid-name
 
 
@@ -32,6 +34,14 @@ class WikiTablesVariableFreeExecutor:
     """
     def __init__(self, table_data: List[Dict[str, CellValueType]]) -> None:
         self.table_data = table_data
+        # Per-table indexes, built lazily the first time a function needs them. They only depend on
+        # the table data, so they are shared by all the worlds that share this executor (see
+        # ``get_executor_for_table``).
+        self._row_indices_by_id: Dict[int, int] = None
+        self._rows_by_column_value: Dict[str, Dict[CellValueType, RowListType]] = {}
+        # Denotations of the sub-expressions in the batch being executed by
+        # ``execute_logical_forms``.
+        self._shared_denotations: Dict[int, Any] = {}
 
     def __eq__(self, other):
         if not isinstance(other, WikiTablesVariableFreeExecutor):
@@ -57,33 +67,100 @@ class WikiTablesVariableFreeExecutor:
         return Date(year, month, day)
 
     def execute(self, logical_form: str) -> Any:
-        if not logical_form.startswith("("):
-            logical_form = f"({logical_form})"
-        logical_form = logical_form.replace(",", " ")
-        expression_as_list = semparse_util.lisp_to_nested_expression(logical_form)
-        # Expression list has an additional level of
-        # nesting at the top. For example, if the
-        # logical form is
-        # "(select all_rows fb:row.row.league)",
-        # the expression list will be
-        # [['select', 'all_rows', 'fb:row.row.league']].
-        # Removing the top most level of nesting.
-        result = self._handle_expression(expression_as_list[0])
-        return result
+        return self.execute_expression(parse_logical_form(logical_form))
+
+    def execute_expression(self, expression: NestedList) -> Any:
+        """
+        Executes an expression that is already in the nested list form ``parse_logical_form``
+        returns, like the ones ``WikiTablesVariableFreeWorld`` builds directly from action
+        sequences.
+        """
+        return self._handle_expression(expression)
+
+    def execute_logical_forms(self, logical_forms: List[str]) -> List[Any]:
+        """
+        Executes a batch of logical forms, and returns their denotations in the same order. All the
+        logical forms are merged into one DAG of unique sub-expressions, and each of those is
+        evaluated only once, which helps a lot when the logical forms come from a search over the
+        same table and share large sub-trees. Logical forms that fail to execute get ``None`` as
+        their denotation.
+        """
+        unique_expressions: Dict[Tuple, Tuple] = {}
+        return self._execute_shared_expressions([parse_shared_logical_form(logical_form, unique_expressions)
+                                                 for logical_form in logical_forms])
+
+    def execute_expressions(self, expressions: List[NestedList]) -> List[Any]:
+        """
+        Batched version of ``execute_expression``, that shares the execution of common
+        sub-expressions the same way ``execute_logical_forms`` does.
+        """
+        unique_expressions: Dict[Tuple, Tuple] = {}
+        return self._execute_shared_expressions([share_expression(expression, unique_expressions)
+                                                 for expression in expressions])
 
     def evaluate_logical_form(self, logical_form: str, target_list: List[str]) -> bool:
         """
         Takes a logical form, and the list of target values as strings from the original lisp
         string, and returns True iff the logical form executes to the target list.
         """
-        normalized_target_list = [TableQuestionContext.normalize_string(value) for value in
-                                  target_list]
-        target_value_list = evaluator.to_value_list(normalized_target_list)
+        return self.evaluate_expression(parse_logical_form(logical_form), target_list)
+
+    def evaluate_expression(self, expression: NestedList, target_list: List[str]) -> bool:
+        """
+        Same as ``evaluate_logical_form``, but takes an already parsed expression.
+        """
+        target_value_list = self._get_target_value_list(target_list)
         try:
-            denotation = self.execute(logical_form)
+            denotation = self.execute_expression(expression)
         except ExecutionError:
-            logger.warning(f'Failed to execute: {logical_form}')
+            DIAGNOSTIC_COUNTS["execution_error"] += 1
             return False
+        return self._denotation_matches_targets(denotation, target_list, target_value_list)
+
+    def evaluate_logical_forms(self, logical_forms: List[str], target_list: List[str]) -> List[bool]:
+        """
+        Batched version of ``evaluate_logical_form``. The logical forms are executed together (see
+        ``execute_logical_forms``), and the target values are normalized only once.
+        """
+        return self._evaluate_denotations(self.execute_logical_forms(logical_forms), target_list)
+
+    def evaluate_expressions(self, expressions: List[NestedList], target_list: List[str]) -> List[bool]:
+        """
+        Batched version of ``evaluate_expression``, executed like ``execute_expressions``.
+        """
+        return self._evaluate_denotations(self.execute_expressions(expressions), target_list)
+
+    ## Helper functions
+    def _execute_shared_expressions(self, expressions: List[Union[str, Tuple]]) -> List[Any]:
+        denotations = []
+        try:
+            for expression in expressions:
+                try:
+                    denotations.append(self._handle_expression(expression))
+                except ExecutionError:
+                    DIAGNOSTIC_COUNTS["execution_error"] += 1
+                    denotations.append(None)
+        finally:
+            # The cache is keyed by the ids of the expressions in this batch.
+            self._shared_denotations.clear()
+        return denotations
+
+    def _evaluate_denotations(self, denotations: List[Any], target_list: List[str]) -> List[bool]:
+        target_value_list = self._get_target_value_list(target_list)
+        return [denotation is not None and
+                self._denotation_matches_targets(denotation, target_list, target_value_list)
+                for denotation in denotations]
+
+    @staticmethod
+    def _get_target_value_list(target_list: List[str]) -> List[evaluator.Value]:
+        normalized_target_list = [TableQuestionContext.normalize_string(value) for value in
+                                  target_list]
+        return evaluator.to_value_list(normalized_target_list)
+
+    def _denotation_matches_targets(self,
+                                    denotation: Any,
+                                    target_list: List[str],
+                                    target_value_list: List[evaluator.Value]) -> bool:
         if isinstance(denotation, list):
             denotation_list = [str(denotation_item) for denotation_item in denotation]
         else:
@@ -93,18 +170,35 @@ class WikiTablesVariableFreeExecutor:
         denotation_value_list = evaluator.to_value_list(denotation_list)
         return evaluator.check_denotation(target_value_list, denotation_value_list)
 
-    ## Helper functions
     def _handle_expression(self, expression_list):
-        if isinstance(expression_list, list) and len(expression_list) == 1:
+        if isinstance(expression_list, (list, tuple)) and len(expression_list) == 1:
             expression = expression_list[0]
         else:
             expression = expression_list
+        if isinstance(expression, tuple):
+            # This is a function application that is shared within a batch of logical forms (see
+            # ``execute_logical_forms``).
+            return self._handle_shared_expression(expression)
         if isinstance(expression, list):
-            # This is a function application.
-            function_name = expression[0]
-        else:
-            # This is a constant (like "all_rows" or "2005")
-            return self._handle_constant(expression)
+            return self._apply_function(expression)
+        # This is a constant (like "all_rows" or "2005")
+        return self._handle_constant(expression)
+
+    def _handle_shared_expression(self, expression: Tuple) -> Any:
+        expression_id = id(expression)
+        if expression_id not in self._shared_denotations:
+            try:
+                self._shared_denotations[expression_id] = self._apply_function(expression)
+            except ExecutionError as error:
+                # Other logical forms containing this sub-expression will fail the same way.
+                self._shared_denotations[expression_id] = error
+        denotation = self._shared_denotations[expression_id]
+        if isinstance(denotation, ExecutionError):
+            raise denotation
+        return denotation
+
+    def _apply_function(self, expression: Union[NestedList, Tuple]) -> Any:
+        function_name = expression[0]
         try:
             function = getattr(self, function_name)
             return function(*expression[1:])
@@ -167,6 +261,13 @@ class WikiTablesVariableFreeExecutor:
         table (which should never happen because this function will only be called with a row that
         is the result of applying one or more functions on the table rows), the method returns -1.
         """
+        if self._row_indices_by_id is None:
+            self._row_indices_by_id = {id(table_row): index
+                                       for index, table_row in enumerate(self.table_data)}
+        # Rows produced by the functions in the language are the table's own row objects, so we
+        # can usually find them by identity. We fall back to comparing values otherwise.
+        if id(row) in self._row_indices_by_id:
+            return self._row_indices_by_id[id(row)]
         row_index = -1
         for index, table_row in enumerate(self.table_data):
             if table_row == row:
@@ -174,6 +275,63 @@ class WikiTablesVariableFreeExecutor:
                 break
         return row_index
 
+    def _get_rows_by_column_value(self, column_name: str) -> Dict[CellValueType, RowListType]:
+        """
+        Returns a mapping from each value under the given column to the rows (in table order) that
+        have that value.
+        """
+        if column_name not in self._rows_by_column_value:
+            rows_by_value: Dict[CellValueType, RowListType] = defaultdict(list)
+            for row in self.table_data:
+                rows_by_value[row[column_name]].append(row)
+            self._rows_by_column_value[column_name] = dict(rows_by_value)
+        return self._rows_by_column_value[column_name]
+
+    def _filter_rows_by_value(self,
+                              row_expression_list: NestedList,
+                              column_name: str,
+                              value_expression: NestedList,
+                              value_type: type,
+                              comparison: Callable[[Any, Any], bool],
+                              keep_none_values: bool = False) -> RowListType:
+        """
+        Shared implementation of the number and date comparison filters. Returns the rows (in the
+        order they are given) whose value in ``column_name`` passes ``comparison`` with the value
+        of ``value_expression``, which should be of type ``value_type``. ``keep_none_values`` is as
+        in ``_get_number_row_pairs_to_filter``.
+        """
+        row_list = self._handle_expression(row_expression_list)
+        if value_type is Date:
+            cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name, keep_none_values)
+        else:
+            cell_row_pairs = self._get_number_row_pairs_to_filter(row_list,  # type: ignore
+                                                                  column_name,
+                                                                  keep_none_values)
+        # Either there are no rows, or none of them have a value in the column. Nothing can pass the
+        # filter, so we do not need to evaluate the value expression.
+        if not cell_row_pairs:
+            return []
+        filter_value = self._handle_expression(value_expression)
+        if not isinstance(filter_value, value_type):
+            raise ExecutionError(f"Invalid filter value: {value_expression}")
+        return [row for cell_value, row in cell_row_pairs if comparison(cell_value, filter_value)]
+
+    def _get_string_filter_value(self, value_expression: NestedList) -> str:
+        """
+        Evaluates the value expression of ``filter_in`` or ``filter_not_in``, which is either a
+        string or a list of strings whose first element we use.
+        """
+        expression_evaluation = self._handle_expression(value_expression)
+        if isinstance(expression_evaluation, list) and expression_evaluation:
+            filter_value = expression_evaluation[0]
+        elif isinstance(expression_evaluation, str):
+            filter_value = expression_evaluation
+        else:
+            raise ExecutionError(f"Unexprected filter value for filter_in: {value_expression}")
+        if not isinstance(filter_value, str):
+            raise ExecutionError(f"Unexprected filter value for filter_in: {value_expression}")
+        return filter_value
+
     ## Functions in the language
     def select_string(self, row_expression_list: NestedList, column_name: str) -> List[str]:
         """
@@ -251,18 +409,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows as an expression, a column, and a numerical value expression and
         returns all the rows where the value in that column is greater than the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_number_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, float):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value > filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          float, operator.gt)
 
     def filter_number_greater_equals(self,
                                      row_expression_list: NestedList,
@@ -273,18 +421,8 @@ class WikiTablesVariableFreeExecutor:
         returns all the rows where the value in that column is greater than or equal to the given
         value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_number_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, float):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value >= filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          float, operator.ge)
 
     def filter_number_lesser(self,
                              row_expression_list: NestedList,
@@ -294,18 +432,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows as an expression, a column, and a numerical value expression and
         returns all the rows where the value in that column is less than the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_number_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, float):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value < filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          float, operator.lt)
 
     def filter_number_lesser_equals(self,
                                     row_expression_list: NestedList,
@@ -315,18 +443,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows, a column, and a numerical value and returns all the rows where the
         value in that column is lesser than or equal to the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_number_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, float):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value <= filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          float, operator.le)
 
     def filter_number_equals(self,
                              row_expression_list: NestedList,
@@ -336,18 +454,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows, a column, and a numerical value and returns all the rows where the
         value in that column equals the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_number_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, float):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value == filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          float, operator.eq)
 
     def filter_number_not_equals(self,
                                  row_expression_list: NestedList,
@@ -357,21 +465,11 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows, a column, and a numerical value and returns all the rows where the
         value in that column is not equal to the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_number_row_pairs_to_filter(row_list, column_name, True)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, float):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value != filter_value:
-                return_list.append(row)
-        return return_list
-
-    # Note that the following six methods are identical to the ones above, except that the filter
-    # values are obtained from `_get_date_row_pairs_to_filter`.
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          float, operator.ne, keep_none_values=True)
+
+    # Note that the following six methods are identical to the ones above, except that they
+    # compare dates.
     def filter_date_greater(self,
                             row_expression_list: NestedList,
                             column_name: str,
@@ -380,18 +478,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows as an expression, a column, and a numerical value expression and
         returns all the rows where the value in that column is greater than the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, Date):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value > filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          Date, operator.gt)
 
     def filter_date_greater_equals(self,
                                    row_expression_list: NestedList,
@@ -402,18 +490,8 @@ class WikiTablesVariableFreeExecutor:
         returns all the rows where the value in that column is greater than or equal to the given
         value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, Date):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value >= filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          Date, operator.ge)
 
     def filter_date_lesser(self,
                            row_expression_list: NestedList,
@@ -423,18 +501,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows as an expression, a column, and a numerical value expression and
         returns all the rows where the value in that column is less than the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, Date):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value < filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          Date, operator.lt)
 
     def filter_date_lesser_equals(self,
                                   row_expression_list: NestedList,
@@ -444,18 +512,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows, a column, and a numerical value and returns all the rows where the
         value in that column is lesser than or equal to the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, Date):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value <= filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          Date, operator.le)
 
     def filter_date_equals(self,
                            row_expression_list: NestedList,
@@ -465,18 +523,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows, a column, and a numerical value and returns all the rows where the
         value in that column equals the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, Date):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value == filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          Date, operator.eq)
 
     def filter_date_not_equals(self,
                                row_expression_list: NestedList,
@@ -486,18 +534,8 @@ class WikiTablesVariableFreeExecutor:
         Takes a list of rows, a column, and a numerical value and returns all the rows where the
         value in that column is not equal to the given value.
         """
-        row_list = self._handle_expression(row_expression_list)
-        if not row_list:
-            return []
-        cell_row_pairs = self._get_date_row_pairs_to_filter(row_list, column_name, True)
-        filter_value = self._handle_expression(value_expression)
-        if not isinstance(filter_value, Date):
-            raise ExecutionError(f"Invalid filter value: {value_expression}")
-        return_list = []
-        for cell_value, row in cell_row_pairs:
-            if cell_value != filter_value:
-                return_list.append(row)
-        return return_list
+        return self._filter_rows_by_value(row_expression_list, column_name, value_expression,
+                                          Date, operator.ne, keep_none_values=True)
 
     def filter_in(self,
                   row_expression_list: NestedList,
@@ -508,26 +546,14 @@ class WikiTablesVariableFreeExecutor:
         in that column contains the given string.
         """
         row_list = self._handle_expression(row_expression_list)
-        if not row_list:
+        cell_row_pairs = [(row[column_name], row) for row in row_list if row[column_name] is not None]
+        # As in the comparison filters, we do not evaluate the value expression if no row can pass.
+        if not cell_row_pairs:
             return []
-        expression_evaluation = self._handle_expression(value_expression)
-        if isinstance(expression_evaluation, list) and expression_evaluation:
-            filter_value = expression_evaluation[0]
-        elif isinstance(expression_evaluation, str):
-            filter_value = expression_evaluation
-        else:
-            raise ExecutionError(f"Unexprected filter value for filter_in: {value_expression}")
-        if not isinstance(filter_value, str):
-            raise ExecutionError(f"Unexprected filter value for filter_in: {value_expression}")
+        filter_value = self._get_string_filter_value(value_expression)
         # Assuming filter value has underscores for spaces. The cell values also have underscores
         # for spaces, so we do not need to replace them here.
-        result_list = []
-        for row in row_list:
-            if row[column_name] is None:
-                continue
-            if filter_value in row[column_name]:
-                result_list.append(row)
-        return result_list
+        return [row for cell_value, row in cell_row_pairs if filter_value in cell_value]
 
     def filter_not_in(self,
                       row_expression_list: NestedList,
@@ -540,15 +566,7 @@ class WikiTablesVariableFreeExecutor:
         row_list = self._handle_expression(row_expression_list)
         if not row_list:
             return []
-        expression_evaluation = self._handle_expression(value_expression)
-        if isinstance(expression_evaluation, list) and expression_evaluation:
-            filter_value = expression_evaluation[0]
-        elif isinstance(expression_evaluation, str):
-            filter_value = expression_evaluation
-        else:
-            raise ExecutionError(f"Unexprected filter value for filter_in: {value_expression}")
-        if not isinstance(filter_value, str):
-            raise ExecutionError(f"Unexprected filter value for filter_in: {value_expression}")
+        filter_value = self._get_string_filter_value(value_expression)
         # Assuming filter value has underscores for spaces. The cell values also have underscores
         # for spaces, so we do not need to replace them here.
         result_list = []
@@ -565,7 +583,7 @@ class WikiTablesVariableFreeExecutor:
         """
         row_list: RowListType = self._handle_expression(row_expression_list)
         if not row_list:
-            logger.warning("Trying to get first row from an empty list: %s", row_expression_list)
+            DIAGNOSTIC_COUNTS["first_of_empty_list"] += 1
             return []
         return [row_list[0]]
 
@@ -576,7 +594,7 @@ class WikiTablesVariableFreeExecutor:
         """
         row_list: RowListType = self._handle_expression(row_expression_list)
         if not row_list:
-            logger.warning("Trying to get last row from an empty list: %s", row_expression_list)
+            DIAGNOSTIC_COUNTS["last_of_empty_list"] += 1
             return []
         return [row_list[-1]]
 
@@ -588,12 +606,10 @@ class WikiTablesVariableFreeExecutor:
         """
         row_list: RowListType = self._handle_expression(row_expression_list)
         if not row_list:
-            logger.warning("Trying to get the previous row from an empty list: %s",
-                           row_expression_list)
+            DIAGNOSTIC_COUNTS["previous_of_empty_list"] += 1
             return []
         if len(row_list) > 1:
-            logger.warning("Trying to get the previous row from a non-singleton list: %s",
-                           row_expression_list)
+            DIAGNOSTIC_COUNTS["previous_of_multiple_rows"] += 1
         input_row_index = self._get_row_index(row_list[0])  # Take the first row.
         if input_row_index > 0:
             return [self.table_data[input_row_index - 1]]
@@ -607,10 +623,10 @@ class WikiTablesVariableFreeExecutor:
         """
         row_list: RowListType = self._handle_expression(row_expression_list)
         if not row_list:
-            logger.warning("Trying to get the next row from an empty list: %s", row_expression_list)
+            DIAGNOSTIC_COUNTS["next_of_empty_list"] += 1
             return []
         if len(row_list) > 1:
-            logger.warning("Trying to get the next row from a non-singleton list: %s", row_expression_list)
+            DIAGNOSTIC_COUNTS["next_of_multiple_rows"] += 1
         input_row_index = self._get_row_index(row_list[-1])  # Take the last row.
         if input_row_index < len(self.table_data) - 1 and input_row_index != -1:
             return [self.table_data[input_row_index + 1]]
@@ -796,14 +812,13 @@ class WikiTablesVariableFreeExecutor:
         if not row_list:
             return []
         if len(row_list) > 1:
-            logger.warning("same_as function got multiple rows. Taking the first one: "
-                           f"{row_expression_list}")
+            DIAGNOSTIC_COUNTS["same_as_of_multiple_rows"] += 1
         cell_value = row_list[0][column_name]
-        return_list = []
-        for row in self.table_data:
-            if row[column_name] == cell_value:
-                return_list.append(row)
-        return return_list
+        # Dates with unknown fields are equal to dates with different hashes, and NaN is not equal
+        # to itself, so we cannot look those up in the value index.
+        if isinstance(cell_value, Date) or (isinstance(cell_value, float) and math.isnan(cell_value)):
+            return [row for row in self.table_data if row[column_name] == cell_value]
+        return list(self._get_rows_by_column_value(column_name).get(cell_value, []))
 
     def diff(self,
              first_row_expression_list: NestedList,
@@ -814,15 +829,15 @@ class WikiTablesVariableFreeExecutor:
         difference between the values under that column in those two rows.
         """
         first_row_list = self._handle_expression(first_row_expression_list)
+        if not first_row_list:
+            return 0.0
         second_row_list = self._handle_expression(second_row_expression_list)
-        if not first_row_list or not second_row_list:
+        if not second_row_list:
             return 0.0
         if len(first_row_list) > 1:
-            logger.warning("diff got multiple rows for first argument. Taking the first one: "
-                           f"{first_row_expression_list}")
+            DIAGNOSTIC_COUNTS["diff_of_multiple_first_rows"] += 1
         if len(second_row_list) > 1:
-            logger.warning("diff got multiple rows for second argument. Taking the first one: "
-                           f"{second_row_expression_list}")
+            DIAGNOSTIC_COUNTS["diff_of_multiple_second_rows"] += 1
         first_row = first_row_list[0]
         second_row = second_row_list[0]
         try:
@@ -1 +1,2 @@
-from weak_supervision.semparse.worlds.wikitables_variable_free_world import WikiTablesVariableFreeWorld
+from weak_supervision.semparse.worlds.wikitables_variable_free_world import (WikiTablesVariableFreeWorld,
+                                                                             LazyWikiTablesVariableFreeWorld)
@@ -7,22 +7,167 @@ an executor for the variable-free logical forms.
 """
 # TODO(pradeep): Merge this class with the `WikiTablesWorld` class, and move all the
 # language-specific functionality into type declarations.
-from typing import Dict, List, Set, Union
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple, Union
+from collections import defaultdict
+from functools import lru_cache
+import itertools
 import re
+import sys
 import logging
+import weakref
 
 from nltk.sem.logic import Type
 from overrides import overrides
 
+from allennlp.data.tokenizers import Token
+from allennlp.semparse.contexts.knowledge_graph import KnowledgeGraph
+from allennlp.semparse.type_declarations import type_declaration
+from allennlp.semparse import util as semparse_util
+from allennlp.semparse.type_declarations.type_declaration import ComplexType, MultiMatchNamedBasicType
 from allennlp.semparse.worlds.world import ParsingError, World
 
+from weak_supervision.common import LruCache
 from weak_supervision.semparse.type_declarations import wikitables_variable_free as types
-from weak_supervision.semparse.contexts import TableQuestionContext
-from weak_supervision.semparse.contexts.table_question_context import MONTH_NUMBERS
+from weak_supervision.semparse.contexts import TableQuestionContext, table_io
 from weak_supervision.semparse.executors import WikiTablesVariableFreeExecutor
+from weak_supervision.semparse.executors.util import NestedList, get_executor_for_table, parse_logical_form
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# The name mappings and type signatures of the functions available for each schema (whether the
+# table has string, date and number columns), and the valid actions and terminal productions they
+# produce. See ``WikiTablesVariableFreeWorld._get_schema_name_mapping``. There are at most eight
+# schemas.
+_SCHEMA_NAME_MAPPINGS: Dict[Tuple[bool, bool, bool], Tuple[Dict[str, str], Dict[str, Type]]] = {}
+_SCHEMA_VALID_ACTIONS: Dict[Tuple[bool, bool, bool], Dict[str, List[str]]] = {}
+_SCHEMA_TERMINAL_PRODUCTIONS: Dict[Tuple[bool, bool, bool], Dict[str, str]] = {}
+
+# The worlds built by the lazy worlds (see ``LazyWikiTablesVariableFreeWorld``) that are not given a
+# cache of their own, like unpickled ones. The cache is keyed by a number that each lazy world gets
+# from ``_LAZY_WORLD_KEYS``, and which is never reused, so the cache does not keep lazy worlds alive.
+MAX_MATERIALIZED_WORLDS = 1024
+_MATERIALIZED_WORLDS: LruCache[int, 'WikiTablesVariableFreeWorld'] = LruCache(MAX_MATERIALIZED_WORLDS)
+_LAZY_WORLD_KEYS = itertools.count()
+# The caches and keys of the lazy worlds that were garbage collected, whose worlds we drop from their
+# caches the next time a lazy world uses a cache. See ``LazyWikiTablesVariableFreeWorld.get_world``.
+_COLLECTED_LAZY_WORLDS: List[Tuple[LruCache[int, 'WikiTablesVariableFreeWorld'], int]] = []
+
+# Whether pickled worlds carry their table. By default they only carry the table id, and the process
+# that unpickles them finds the table by its id (see ``table_io.get_table_from_id``), which works for
+# tables read from files that have not changed since. Set this to pickle worlds about other tables.
+PICKLE_TABLES_WITH_WORLDS = False
+
+# Characters the executor's lisp parser treats specially. Expressions with names containing these
+# are built by rendering and parsing the logical form instead, so that they execute the same way.
+_LISP_SPECIAL_CHARACTERS_REGEX = re.compile(r"[(),\s]")
+
+
+class _AgendaTrigger(NamedTuple):
+    """
+    A rule that adds ``item`` to the agenda if the question has any of ``tokens`` or ``phrases``
+    (or any of ``liberal_tokens``, unless the agenda is conservative), has all of
+    ``required_tokens``, and has none of ``excluded_tokens`` and ``excluded_phrases``. Phrases are
+    matched as substrings of the question joined with spaces.
+    """
+    item: str
+    tokens: FrozenSet[str] = frozenset()
+    phrases: FrozenSet[str] = frozenset()
+    liberal_tokens: FrozenSet[str] = frozenset()
+    required_tokens: FrozenSet[str] = frozenset()
+    excluded_tokens: FrozenSet[str] = frozenset()
+    excluded_phrases: FrozenSet[str] = frozenset()
+    needs_number_columns: bool = False
+    needs_date_columns: bool = False
+
+
+# Number filters. We keep track of whether these were triggered, because we do not want to add both
+# number and date filters to a conservative agenda.
+_NUMBER_FILTER_TRIGGERS = (
+        _AgendaTrigger("filter_number_greater_equals", phrases=frozenset(["at least"]),
+                       needs_number_columns=True),
+        _AgendaTrigger("filter_number_lesser_equals",
+                       phrases=frozenset(["at most", "no greater than", "no larger than", "no more than"]),
+                       needs_number_columns=True),
+        _AgendaTrigger("filter_number_greater",
+                       phrases=frozenset(["greater than", "larger than", "more than"]),
+                       excluded_phrases=frozenset(["no greater than", "no larger than", "no more than"]),
+                       needs_number_columns=True),
+        )
+
+_AGENDA_TRIGGERS = _NUMBER_FILTER_TRIGGERS + (
+        _AgendaTrigger("next", tokens=frozenset(["next", "below"]), liberal_tokens=frozenset(["after"])),
+        _AgendaTrigger("previous", tokens=frozenset(["previous", "above"]), liberal_tokens=frozenset(["before"])),
+        _AgendaTrigger("first", tokens=frozenset(["first", "top"])),
+        _AgendaTrigger("last", tokens=frozenset(["last", "bottom"])),
+        _AgendaTrigger("same_as", tokens=frozenset(["same"])),
+        # "total" does not always map to an actual summing operation.
+        _AgendaTrigger("sum", liberal_tokens=frozenset(["total"]), needs_number_columns=True),
+        _AgendaTrigger("diff", tokens=frozenset(["difference"]),
+                       phrases=frozenset(["how many more", "how much more"]), needs_number_columns=True),
+        _AgendaTrigger("average", tokens=frozenset(["average"]), needs_number_columns=True),
+        # These conditions are too brittle. But for most logical forms with "min" and "max", there
+        # are semantically equivalent ones with "argmin" and "argmax". The exceptions are rare.
+        _AgendaTrigger("argmin", tokens=frozenset(["least", "smallest", "shortest", "lowest"]),
+                       excluded_phrases=frozenset(["at least", "what is the least"]), needs_number_columns=True),
+        _AgendaTrigger("argmax", tokens=frozenset(["most", "largest", "highest", "longest", "greatest"]),
+                       excluded_phrases=frozenset(["at most", "what is the most"]), needs_number_columns=True),
+        _AgendaTrigger("min_number", phrases=frozenset(["what is the least"]), needs_number_columns=True),
+        _AgendaTrigger("max_number", phrases=frozenset(["what is the most"]), needs_number_columns=True),
+        _AgendaTrigger("max_date", tokens=frozenset(["when"]), required_tokens=frozenset(["last"]),
+                       needs_date_columns=True),
+        _AgendaTrigger("min_date", tokens=frozenset(["when"]), required_tokens=frozenset(["first"]),
+                       excluded_tokens=frozenset(["last"]), needs_date_columns=True),
+        _AgendaTrigger("select_date", tokens=frozenset(["when"]), excluded_tokens=frozenset(["last", "first"]),
+                       needs_date_columns=True),
+        )
+
+# All the phrases the triggers look for, so that we search for each of them once per question.
+_AGENDA_TRIGGER_PHRASES = frozenset(["how many"]).union(*[trigger.phrases | trigger.excluded_phrases
+                                                          for trigger in _AGENDA_TRIGGERS])
+
+@lru_cache(maxsize=100000)
+def _split_action(action: str) -> Tuple[str, str, Optional[Tuple[str, ...]]]:
+    """
+    Returns the left side and the right side of an action, and if the right side is a non-terminal
+    expansion, the child types in it (as ``World._construct_node_from_actions`` reads them).
+    Actions are shared by all worlds, so we only do this once per action.
+    """
+    left_side, right_side = action.split(" -> ")
+    child_types = None
+    if right_side[0] == '[':
+        child_types = tuple(child_type[1:-1] if child_type.startswith("'lambda") else child_type
+                            for child_type in right_side[1:-1].split(', '))
+    return left_side, right_side, child_types
+
+
+def _get_table_context_state(table_context: TableQuestionContext) -> Dict:
+    """
+    Returns what we pickle worlds as: the table id, the text of the question tokens (which may be
+    spacy tokens, which cannot be pickled), the entities and numbers found in the question, and the
+    knowledge graph. Everything else is built again when unpickling. The graph is the one in the
+    ``KnowledgeGraphField`` of the instance, so in a pickled instance it is only pickled once, and
+    the unpickled world and field share it, with its entities in the same order. The table itself
+    is only pickled if ``PICKLE_TABLES_WITH_WORLDS`` is set.
+    """
+    if table_context.table_id is None and not PICKLE_TABLES_WITH_WORLDS:
+        raise ValueError("Cannot pickle a world about a table without an id, unless "
+                         "PICKLE_TABLES_WITH_WORLDS is set")
+    return {"table_id": table_context.table_id,
+            "table_context": table_context.with_question([]) if PICKLE_TABLES_WITH_WORLDS else None,
+            "question_tokens": [token.text for token in table_context.question_tokens],
+            "question_entities_and_numbers": table_context.get_entities_from_question(),
+            "table_knowledge_graph": table_context.get_table_knowledge_graph()}
+
+
+def _get_table_context_from_state(state: Dict) -> TableQuestionContext:
+    table_context = state["table_context"]
+    if state["table_id"] is not None:
+        # Worlds about the same table share it, through the per-process cache of tables.
+        table_context = table_io.get_table_from_id(state["table_id"], table_context)
+    return table_context.with_question([Token(text) for text in state["question_tokens"]],
+                                       state["question_entities_and_numbers"],
+                                       state["table_knowledge_graph"])
+
 
 class WikiTablesVariableFreeWorld(World):
     """
@@ -57,39 +202,32 @@ class WikiTablesVariableFreeWorld(World):
                          global_name_mapping=types.COMMON_NAME_MAPPING)
         self.table_context = table_context
         # We add name mapping and signatures corresponding to specific column types to the local
-        # name mapping based on the table content here.
+        # name mapping based on the table content here. These only depend on which types of
+        # columns the table has, so we get them from a cache shared by all worlds.
         column_types = table_context.column_types
-        self._table_has_string_columns = False
-        self._table_has_date_columns = False
-        self._table_has_number_columns = False
-        if "string" in column_types:
-            for name, translated_name in types.STRING_COLUMN_NAME_MAPPING.items():
-                signature = types.STRING_COLUMN_TYPE_SIGNATURE[translated_name]
-                self._add_name_mapping(name, translated_name, signature)
-            self._table_has_string_columns = True
-        if "date" in column_types:
-            for name, translated_name in types.DATE_COLUMN_NAME_MAPPING.items():
-                signature = types.DATE_COLUMN_TYPE_SIGNATURE[translated_name]
-                self._add_name_mapping(name, translated_name, signature)
+        self._table_has_string_columns = "string" in column_types
+        self._table_has_date_columns = "date" in column_types
+        self._table_has_number_columns = "number" in column_types or "num2" in column_types
+        self._schema = (self._table_has_string_columns,
+                        self._table_has_date_columns,
+                        self._table_has_number_columns)
+        schema_name_mapping, schema_type_signatures = self._get_schema_name_mapping(self._schema)
+        self.local_name_mapping.update(schema_name_mapping)
+        self.local_type_signatures.update(schema_type_signatures)
+        for name, translated_name in schema_name_mapping.items():
+            self.reverse_name_mapping[translated_name] = name
+        if self._table_has_date_columns:
             # Adding -1 to mapping because we need it for dates where not all three fields are
             # specified. We want to do this only when the table has a date column. This is because
             # the knowledge graph is also constructed in such a way that -1 is an entity with date
             # columns as the neighbors only if any date columns exist in the table.
             self._map_name(f"num:-1", keep_mapping=True)
-            self._table_has_date_columns = True
-        if "number" in column_types or "num2" in column_types:
-            for name, translated_name in types.NUMBER_COLUMN_NAME_MAPPING.items():
-                signature = types.NUMBER_COLUMN_TYPE_SIGNATURE[translated_name]
-                self._add_name_mapping(name, translated_name, signature)
-            self._table_has_number_columns = True
-        if "date" in column_types or "number" in column_types or "num2" in column_types:
-            for name, translated_name in types.COMPARABLE_COLUMN_NAME_MAPPING.items():
-                signature = types.COMPARABLE_COLUMN_TYPE_SIGNATURE[translated_name]
-                self._add_name_mapping(name, translated_name, signature)
 
         self.table_graph = table_context.get_table_knowledge_graph()
 
-        self._executor = WikiTablesVariableFreeExecutor(self.table_context.table_data)
+        # We only get the executor when the world first executes something, so worlds that are only
+        # used for their grammar, like the ones the dataset reader makes fields with, never get one.
+        self._table_executor: WikiTablesVariableFreeExecutor = None
 
         # TODO (pradeep): Use a NameMapper for mapping entity names too.
         # For every new column name seen, we update this counter to map it to a new NLTK name.
@@ -113,18 +251,158 @@ class WikiTablesVariableFreeWorld(World):
         for column_name in table_context.table_data[0].keys():
             self._map_name(column_name, keep_mapping=True)
 
-        self.terminal_productions: Dict[str, str] = {}
-        name_mapping = [(name, mapping) for name, mapping in self.global_name_mapping.items()]
-        name_mapping += [(name, mapping) for name, mapping in self.local_name_mapping.items()]
-        signatures = self.global_type_signatures.copy()
-        signatures.update(self.local_type_signatures)
-        for predicate, mapped_name in name_mapping:
-            if mapped_name in signatures:
-                signature = signatures[mapped_name]
-                self.terminal_productions[predicate] = f"{signature} -> {predicate}"
+        # The terminal productions of the functions in the language only depend on the schema, so we
+        # start from a copy of the ones for the schema, and only add the instance specific ones.
+        self.terminal_productions: Dict[str, str] = dict(self._get_schema_terminal_productions(self._schema))
+        for predicate, mapped_name in self.local_name_mapping.items():
+            if predicate in schema_name_mapping:
+                continue
+            if mapped_name in self.local_type_signatures:
+                signature = self.local_type_signatures[mapped_name]
+            elif mapped_name in self.global_type_signatures:
+                signature = self.global_type_signatures[mapped_name]
+            else:
+                continue
+            self.terminal_productions[predicate] = f"{signature} -> {predicate}"
 
         # We don't need to recompute this ever; let's just compute it once and cache it.
         self._valid_actions: Dict[str, List[str]] = None
+        # The same goes for these, which come from the valid actions. ``_instance_specific_actions``
+        # are the productions of the names that are not in the schema's name mapping.
+        self._instance_specific_actions: Set[str] = None
+        self._all_possible_actions: List[str] = None
+        self._instance_specific_action_flags: List[bool] = None
+        # The string version of the multi match mapping, used for rendering logical forms.
+        self._multi_matched_types: Dict[str, Set[str]] = None
+        # Agendas for each value of the ``conservative`` flag, and the parts of the question and the
+        # column names they are matched against (see ``get_agenda``). These are computed when first
+        # needed.
+        self._agendas: Dict[bool, List[str]] = {}
+        self._normalized_question: str = None
+        self._agenda_column_names: Dict[str, Tuple[str, str, List[str]]] = None
+
+    def __getstate__(self):
+        return _get_table_context_state(self.table_context)
+
+    def __setstate__(self, state) -> None:
+        self.__init__(_get_table_context_from_state(state))
+
+    @property
+    def _executor(self) -> WikiTablesVariableFreeExecutor:
+        if self._table_executor is None:
+            table_data = self.table_context.table_data
+            self._table_executor = get_executor_for_table(self.table_context.table_id,
+                                                          lambda: WikiTablesVariableFreeExecutor(table_data))
+        return self._table_executor
+
+    @staticmethod
+    def _get_schema_name_mapping(schema: Tuple[bool, bool, bool]) -> Tuple[Dict[str, str], Dict[str, Type]]:
+        """
+        Returns the name mapping and type signatures of the functions that are available for tables
+        with the given ``schema`` (whether the table has string, date and number columns). These
+        are cached, and must not be modified.
+        """
+        if schema not in _SCHEMA_NAME_MAPPINGS:
+            has_string_columns, has_date_columns, has_number_columns = schema
+            name_mappings_and_signatures = []
+            if has_string_columns:
+                name_mappings_and_signatures.append((types.STRING_COLUMN_NAME_MAPPING,
+                                                     types.STRING_COLUMN_TYPE_SIGNATURE))
+            if has_date_columns:
+                name_mappings_and_signatures.append((types.DATE_COLUMN_NAME_MAPPING,
+                                                     types.DATE_COLUMN_TYPE_SIGNATURE))
+            if has_number_columns:
+                name_mappings_and_signatures.append((types.NUMBER_COLUMN_NAME_MAPPING,
+                                                     types.NUMBER_COLUMN_TYPE_SIGNATURE))
+            if has_date_columns or has_number_columns:
+                name_mappings_and_signatures.append((types.COMPARABLE_COLUMN_NAME_MAPPING,
+                                                     types.COMPARABLE_COLUMN_TYPE_SIGNATURE))
+            name_mapping: Dict[str, str] = {}
+            type_signatures: Dict[str, Type] = {}
+            for column_name_mapping, column_type_signatures in name_mappings_and_signatures:
+                for name, translated_name in column_name_mapping.items():
+                    name_mapping[name] = translated_name
+                    type_signatures[translated_name] = column_type_signatures[translated_name]
+            _SCHEMA_NAME_MAPPINGS[schema] = (name_mapping, type_signatures)
+        return _SCHEMA_NAME_MAPPINGS[schema]
+
+    def _get_schema_terminal_productions(self, schema: Tuple[bool, bool, bool]) -> Dict[str, str]:
+        """
+        Returns the terminal productions of the global functions and of the functions available for
+        the given ``schema`` (see ``_get_schema_name_mapping``). These are cached, and must not be
+        modified.
+        """
+        if schema not in _SCHEMA_TERMINAL_PRODUCTIONS:
+            schema_name_mapping, schema_type_signatures = self._get_schema_name_mapping(schema)
+            signatures = {**self.global_type_signatures, **schema_type_signatures}
+            terminal_productions: Dict[str, str] = {}
+            for name_mapping in [self.global_name_mapping, schema_name_mapping]:
+                for predicate, mapped_name in name_mapping.items():
+                    if mapped_name in signatures:
+                        terminal_productions[predicate] = f"{signatures[mapped_name]} -> {predicate}"
+            _SCHEMA_TERMINAL_PRODUCTIONS[schema] = terminal_productions
+        return _SCHEMA_TERMINAL_PRODUCTIONS[schema]
+
+    @overrides
+    def get_valid_actions(self) -> Dict[str, List[str]]:
+        """
+        The valid actions are the same as what ``World.get_valid_actions`` computes, but we only
+        compute the productions that come from the functions in the language once per schema (see
+        ``_get_schema_name_mapping``), and add the productions for the instance specific entities
+        (columns, strings and numbers) to them.
+        """
+        if not self._valid_actions:
+            schema_name_mapping, _ = self._get_schema_name_mapping(self._schema)
+            instance_specific_actions: Set[str] = set()
+            if self._schema not in _SCHEMA_VALID_ACTIONS:
+                _SCHEMA_VALID_ACTIONS[self._schema] = type_declaration.get_valid_actions(
+                        {**self.global_name_mapping, **schema_name_mapping},
+                        self.get_type_signatures(),
+                        self.get_basic_types(),
+                        valid_starting_types=self.get_valid_starting_types(),
+                        multi_match_mapping=self.get_multi_match_mapping())
+            valid_actions: Dict[str, Set[str]] = defaultdict(set)
+            for key, productions in _SCHEMA_VALID_ACTIONS[self._schema].items():
+                valid_actions[key].update(productions)
+            type_signatures = self.get_type_signatures()
+            for name, translated_name in self.local_name_mapping.items():
+                if name in schema_name_mapping:
+                    continue
+                name_type = type_signatures[translated_name]
+                if isinstance(name_type, ComplexType):
+                    # Instance specific entities all have basic types, but in case that changes, we
+                    # let the base class deal with it.
+                    return super().get_valid_actions()
+                action = f"{name_type} -> {name}"
+                valid_actions[str(name_type)].add(action)
+                instance_specific_actions.add(action)
+            self._valid_actions = {key: sorted(productions) for key, productions in valid_actions.items()}
+            self._instance_specific_actions = instance_specific_actions
+        return self._valid_actions
+
+    @overrides
+    def all_possible_actions(self) -> List[str]:
+        if self._all_possible_actions is None:
+            self._all_possible_actions = super().all_possible_actions()
+        return list(self._all_possible_actions)
+
+    def get_instance_specific_action_flags(self) -> List[bool]:
+        """
+        Returns whether the right side of each action in ``all_possible_actions()``, in the same
+        order, is an instance specific entity (see ``is_instance_specific_entity``). Those are
+        exactly the productions ``get_valid_actions`` adds for the names that are not in the
+        schema's name mapping, so we do not classify each action.
+        """
+        if self._instance_specific_action_flags is None:
+            all_actions = self.all_possible_actions()
+            if self._instance_specific_actions is None:
+                # ``get_valid_actions`` fell back to the base class.
+                self._instance_specific_action_flags = [
+                        self.is_instance_specific_entity(_split_action(action)[1]) for action in all_actions]
+            else:
+                self._instance_specific_action_flags = [action in self._instance_specific_actions
+                                                        for action in all_actions]
+        return list(self._instance_specific_action_flags)
 
     @staticmethod
     def is_instance_specific_entity(entity_name: str) -> bool:
@@ -174,7 +452,8 @@ class WikiTablesVariableFreeWorld(World):
             else:
                 column_type = types.DATE_COLUMN_TYPE
             self._add_name_mapping(name, translated_name, column_type)
-            self._column_productions_for_agenda[name] = f"{column_type} -> {name}"
+            # Productions are interned like the column names, since every world on a table has them.
+            self._column_productions_for_agenda[name] = sys.intern(f"{column_type} -> {name}")
         elif name.startswith("string:"):
             # We do not need to translate these names.
             translated_name = name
@@ -204,6 +483,188 @@ class WikiTablesVariableFreeWorld(World):
                 translated_name = self.local_name_mapping[name]
         return translated_name
 
+    def get_action_sequence_for_logical_form(self, logical_form: str) -> List[str]:
+        """
+        Returns the action sequence that produces the given logical form. This gives the same
+        result as ``get_action_sequence(parse_logical_form(logical_form))``, but we compute it
+        directly from the nested expression, using the name mapping and the type signatures,
+        instead of going through NLTK's logic parser and type inference, which are slow. If the
+        logical form uses anything we do not handle here (like ill-typed or partial function
+        applications), we fall back to the NLTK route, so errors are the same too.
+
+        Raises ``ParsingError`` if the logical form contains names that are not in the world.
+        """
+        lisp_form = logical_form if logical_form.startswith("(") else f"({logical_form})"
+        if re.search(r"\((var )?[x-z]\)", lisp_form) is None:
+            # Logical forms in this language do not have lambdas, and ``parse_logical_form`` would
+            # rewrite their variables.
+            parsed_lisp = semparse_util.lisp_to_nested_expression(lisp_form)
+            type_and_actions = self._get_type_and_actions(parsed_lisp)
+            if type_and_actions is not None:
+                expression_type, actions = type_and_actions
+                return [f"{type_declaration.START_TYPE} -> {expression_type}"] + actions
+        return self.get_action_sequence(self.parse_logical_form(logical_form))
+
+    def _get_type_and_actions(self, nested_expression) -> Optional[Tuple[Type, List[str]]]:
+        """
+        Returns the type of the (nested list) expression, and the actions that produce it, in the
+        order ``World._get_transitions`` outputs them for the NLTK expression. Returns ``None`` for
+        expressions that we leave to NLTK.
+        """
+        if isinstance(nested_expression, str):
+            translated_name = self._map_name(nested_expression)
+            name_type = self.local_type_signatures.get(translated_name,
+                                                       self.global_type_signatures.get(translated_name))
+            if name_type is None:
+                return None
+            name = self.reverse_name_mapping.get(translated_name, translated_name)
+            return name_type, [f"{name_type} -> {name}"]
+        if not nested_expression:
+            return None
+        if len(nested_expression) == 1:
+            # A single name or expression in parentheses is the same as the name or expression.
+            return self._get_type_and_actions(nested_expression[0])
+        if not isinstance(nested_expression[0], str):
+            return None
+        return self._get_application_type_and_actions(nested_expression[0], nested_expression[1:])
+
+    def _get_application_type_and_actions(self,
+                                          function_name: str,
+                                          arguments: list) -> Optional[Tuple[Type, List[str]]]:
+        """
+        Does what ``_get_type_and_actions`` does for the application of the named function to the
+        (nested list) arguments.
+        """
+        function_type_and_actions = self._get_type_and_actions(function_name)
+        if function_type_and_actions is None:
+            return None
+        function_type, function_actions = function_type_and_actions
+        argument_types = []
+        argument_actions = []
+        # The types of the function applied to the first 0, 1, 2, ... arguments.
+        application_types = [function_type]
+        for argument in arguments:
+            argument_type_and_actions = self._get_type_and_actions(argument)
+            if argument_type_and_actions is None:
+                return None
+            argument_type, actions = argument_type_and_actions
+            current_type = application_types[-1]
+            if not isinstance(current_type, ComplexType):
+                return None
+            expected_type = current_type.first
+            if argument_type != expected_type and not (isinstance(expected_type, MultiMatchNamedBasicType)
+                                                       and argument_type in expected_type.types_to_match):
+                return None
+            argument_types.append(argument_type)
+            argument_actions.extend(actions)
+            application_types.append(current_type.second)
+        num_arguments = len(argument_types)
+        if function_type in self.curried_functions:
+            # NLTK curries these, but we produce a single action with all the arguments.
+            if num_arguments != self.curried_functions[function_type]:
+                return None
+            right_side = ", ".join(str(type_) for type_ in [function_type] + argument_types)
+            actions = [f"{application_types[-1]} -> [{right_side}]"]
+        else:
+            # One action per argument, for each curried application, starting from the last one.
+            actions = [f"{application_types[index + 1]} -> [{application_types[index]}, {argument_types[index]}]"
+                       for index in reversed(range(num_arguments))]
+        return application_types[-1], actions + function_actions + argument_actions
+
+    @overrides
+    def get_logical_form(self,
+                         action_sequence: List[str],
+                         add_var_function: bool = True) -> str:
+        """
+        Renders the logical form in one pass over the action sequence, reading the children of
+        each non-terminal expansion from a table of split actions, without building an NLTK tree.
+        The output is the same as ``World.get_logical_form``. For invalid action sequences, we let
+        the base class raise its ``ParsingError``.
+        """
+        if action_sequence:
+            actions = [_split_action(action) for action in action_sequence]
+            try:
+                logical_form, num_used_actions = self._render_node(actions[0][1], actions, 1, add_var_function)
+                if num_used_actions == len(actions):
+                    return logical_form
+            except (IndexError, ParsingError):
+                pass
+        return super().get_logical_form(action_sequence, add_var_function)
+
+    def _render_node(self,
+                     node_type: str,
+                     actions: List[Tuple[str, str, Optional[Tuple[str, ...]]]],
+                     action_index: int,
+                     add_var_function: bool,
+                     as_expression: bool = False) -> Tuple[Union[str, NestedList], int]:
+        """
+        Renders the subtree of type ``node_type`` produced by the actions starting at
+        ``action_index``, and returns it with the index of the first action after the subtree.
+        If ``as_expression`` is True, function applications are returned as nested lists, the way
+        the executor parses them, instead of strings. Raises ``ParsingError`` or ``IndexError`` if
+        the actions do not make a valid subtree.
+        """
+        left_side, right_side, child_types = actions[action_index]
+        action_index += 1
+        if left_side != node_type and left_side not in self._get_multi_matched_types().get(node_type, ()):
+            raise ParsingError("Current node does not match next action")
+        if child_types is None:
+            if not self.is_terminal(right_side):
+                raise ParsingError(f"Found a unary production rule: {left_side} -> {right_side}")
+            if add_var_function and right_side in self._lambda_variables:
+                right_side = f"(var {right_side})"
+            if add_var_function and right_side == 'var':
+                raise ParsingError('add_var_function was true, but action sequence already had var')
+            if as_expression and _LISP_SPECIAL_CHARACTERS_REGEX.search(right_side):
+                raise ParsingError(f"Cannot build an expression with {right_side} without parsing it")
+            return right_side, action_index
+        if len(child_types) == 1:
+            # ``nltk_tree_to_logical_form`` outputs the label of a single child, without expanding it.
+            if not self.is_terminal(child_types[0]):
+                _, action_index = self._render_node(child_types[0], actions, action_index, add_var_function,
+                                                    as_expression)
+            if as_expression and _LISP_SPECIAL_CHARACTERS_REGEX.search(child_types[0]):
+                raise ParsingError(f"Cannot build an expression with {child_types[0]} without parsing it")
+            return child_types[0], action_index
+        rendered_children = []
+        for child_type in child_types:
+            if self.is_terminal(child_type):
+                if as_expression and _LISP_SPECIAL_CHARACTERS_REGEX.search(child_type):
+                    raise ParsingError(f"Cannot build an expression with {child_type} without parsing it")
+                rendered_children.append(child_type)
+            else:
+                rendered_child, action_index = self._render_node(child_type, actions, action_index,
+                                                                 add_var_function, as_expression)
+                rendered_children.append(rendered_child)
+        if as_expression:
+            return rendered_children, action_index
+        return f"({' '.join(rendered_children)})", action_index
+
+    def _get_expression_for_action_sequence(self, action_sequence: List[str]) -> NestedList:
+        """
+        Builds the expression the executor would get by parsing ``get_logical_form(action_sequence)``,
+        directly from the actions. For action sequences we cannot build expressions from, we
+        render and parse the logical form, so that they fail (or execute) in the same way.
+        """
+        if action_sequence:
+            actions = [_split_action(action) for action in action_sequence]
+            try:
+                expression, num_used_actions = self._render_node(actions[0][1], actions, 1,
+                                                                 add_var_function=True, as_expression=True)
+                if num_used_actions == len(actions):
+                    return expression
+            except (IndexError, ParsingError):
+                pass
+        logical_form = self.get_logical_form(action_sequence)
+        return parse_logical_form(logical_form)
+
+    def _get_multi_matched_types(self) -> Dict[str, Set[str]]:
+        if self._multi_matched_types is None:
+            self._multi_matched_types = {}
+            for multi_match_type, matched_types in self.get_multi_match_mapping().items():
+                self._multi_matched_types[str(multi_match_type)] = {str(type_) for type_ in matched_types}
+        return self._multi_matched_types
+
     def get_agenda(self,
                    conservative: bool = False):
         """
@@ -218,94 +679,46 @@ class WikiTablesVariableFreeWorld(World):
             that case, you;ll want this agenda to have close to perfect precision, at the cost of a
             lower recall. You may not want to set this flag if you are sorting the output from a
             search procedure based on how much of this agenda is satisfied.
+
+        The agenda is computed once for each value of ``conservative``, and a copy of it is
+        returned on later calls.
         """
-        agenda_items = []
+        conservative = bool(conservative)
+        if conservative not in self._agendas:
+            self._agendas[conservative] = self._compute_agenda(conservative)
+        return list(self._agendas[conservative])
+
+    def _compute_agenda(self, conservative: bool) -> List[str]:
         question_tokens = [token.text for token in self.table_context.question_tokens]
+        question_token_tags = self.table_context.get_question_token_tags()
         question = " ".join(question_tokens)
-
-        added_number_filters = False
-        if self._table_has_number_columns:
-            if "at least" in question:
-                agenda_items.append("filter_number_greater_equals")
-            if "at most" in question:
-                agenda_items.append("filter_number_lesser_equals")
-
-            comparison_triggers = ["greater", "larger", "more"]
-            if any(f"no {word} than" in question for word in comparison_triggers):
-                agenda_items.append("filter_number_lesser_equals")
-            elif any(f"{word} than" in question for word in comparison_triggers):
-                agenda_items.append("filter_number_greater")
-
-            # We want to keep track of this because we do not want to add both number and date
-            # filters to the agenda if we want to be conservative.
-            if agenda_items:
-                added_number_filters = True
-        for token in question_tokens:
-            if token in ["next", "below"] or (token == "after" and not conservative):
-                agenda_items.append("next")
-            if token in ["previous", "above"] or (token == "before" and not conservative):
-                agenda_items.append("previous")
-            if token in ["first", "top"]:
-                agenda_items.append("first")
-            if token in ["last", "bottom"]:
-                agenda_items.append("last")
-            if token == "same":
-                agenda_items.append("same_as")
-
-            if self._table_has_number_columns:
-                # "total" does not always map to an actual summing operation.
-                if token == "total" and not conservative:
-                    agenda_items.append("sum")
-                if token == "difference" or "how many more" in question or "how much more" in question:
-                    agenda_items.append("diff")
-                if token == "average":
-                    agenda_items.append("average")
-                if token in ["least", "smallest", "shortest", "lowest"] and "at least" not in question:
-                    # This condition is too brittle. But for most logical forms with "min", there are
-                    # semantically equivalent ones with "argmin". The exceptions are rare.
-                    if "what is the least" not in question:
-                        agenda_items.append("argmin")
-                if token in ["most", "largest", "highest", "longest", "greatest"] and "at most" not in question:
-                    # This condition is too brittle. But for most logical forms with "max", there are
-                    # semantically equivalent ones with "argmax". The exceptions are rare.
-                    if "what is the most" not in question:
-                        agenda_items.append("argmax")
-
-            if self._table_has_date_columns:
-                if token in MONTH_NUMBERS or (token.isdigit() and len(token) == 4 and
-                                              int(token) < 2100 and int(token) > 1100):
-                    # Token is either a month or an year. We'll add date functions.
-                    if not added_number_filters or not conservative:
-                        if "after" in question_tokens:
-                            agenda_items.append("filter_date_greater")
-                        elif "before" in question_tokens:
-                            agenda_items.append("filter_date_lesser")
-                        elif "not" in question_tokens:
-                            agenda_items.append("filter_date_not_equals")
-                        else:
-                            agenda_items.append("filter_date_equals")
-
-            if "what is the least" in question and self._table_has_number_columns:
-                agenda_items.append("min_number")
-            if "what is the most" in question and self._table_has_number_columns:
-                agenda_items.append("max_number")
-            if "when" in question_tokens and self._table_has_date_columns:
-                if "last" in question_tokens:
-                    agenda_items.append("max_date")
-                elif "first" in question_tokens:
-                    agenda_items.append("min_date")
+        question_token_set = set(question_tokens)
+        question_phrases = {phrase for phrase in _AGENDA_TRIGGER_PHRASES if phrase in question}
+
+        agenda_items = [trigger.item for trigger in _AGENDA_TRIGGERS
+                        if self._is_agenda_triggered(trigger, question_token_set, question_phrases,
+                                                     conservative)]
+        added_number_filters = any(trigger.item in agenda_items for trigger in _NUMBER_FILTER_TRIGGERS)
+        if self._table_has_date_columns and (not added_number_filters or not conservative):
+            if any(token_tags.is_month or token_tags.is_year for token_tags in question_token_tags):
+                # A token is either a month or an year. We'll add date functions.
+                if "after" in question_token_set:
+                    agenda_items.append("filter_date_greater")
+                elif "before" in question_token_set:
+                    agenda_items.append("filter_date_lesser")
+                elif "not" in question_token_set:
+                    agenda_items.append("filter_date_not_equals")
                 else:
-                    agenda_items.append("select_date")
-
+                    agenda_items.append("filter_date_equals")
 
-        if "how many" in question:
+        if "how many" in question_phrases:
             if "sum" not in agenda_items and "average" not in agenda_items:
                 # The question probably just requires counting the rows. But this is not very
                 # accurate. The question could also be asking for a value that is in the table.
                 agenda_items.append("count")
         agenda = []
         # Adding productions from the global set.
-        for agenda_item in set(agenda_items):
+        for agenda_item in agenda_items:
             # Some agenda items may not be present in the terminal productions because some of these
             # terminals are table-content specific. For example, if the question triggered "sum",
             # and the table does not have number columns, we should not add "<r,<f,n>> -> sum" to
@@ -320,7 +733,7 @@ class WikiTablesVariableFreeWorld(World):
             # we won't add any of them. So we'll first identify such column names.
             refined_column_productions: Dict[str, str] = {}
             for column_name, signature in self._column_productions_for_agenda.items():
-                column_type, name = column_name.split(":")
+                column_type, name, _ = self._get_agenda_column_names()[column_name]
                 if column_type == "string_column":
                     if f"number_column:{name}" not in self._column_productions_for_agenda and \
                        f"date_column:{name}" not in self._column_productions_for_agenda:
@@ -351,8 +764,7 @@ class WikiTablesVariableFreeWorld(World):
             refined_numbers = list(self._question_numbers)
 
         # Adding column names that occur in question.
-        question_with_underscores = "_".join(question_tokens)
-        normalized_question = re.sub("[^a-z0-9_]", "", question_with_underscores)
+        normalized_question = self._get_normalized_question()
         # We keep track of tokens that are in column names being added to the agenda. We will not
         # add string productions to the agenda if those tokens were already captured as column
         # names.
@@ -361,12 +773,11 @@ class WikiTablesVariableFreeWorld(World):
         # adding fewer rules to the agenda.
         tokens_in_column_names: Set[str] = set()
         for column_name_with_type, signature in refined_column_productions.items():
-            column_name = column_name_with_type.split(":")[1]
+            _, column_name, column_name_tokens = self._get_agenda_column_names()[column_name_with_type]
             # Underscores ensure that the match is of whole words.
             if f"_{column_name}_" in normalized_question:
                 agenda.append(signature)
-                for token in column_name.split("_"):
-                    tokens_in_column_names.add(token)
+                tokens_in_column_names.update(column_name_tokens)
 
         # Adding all productions that lead to entities and numbers extracted from the question.
         for entity in refined_entities:
@@ -382,6 +793,40 @@ class WikiTablesVariableFreeWorld(World):
                 agenda.append(f"{types.NUMBER_TYPE} -> {number}")
         return agenda
 
+    def _get_normalized_question(self) -> str:
+        if self._normalized_question is None:
+            question_with_underscores = "_".join(token.text for token in self.table_context.question_tokens)
+            self._normalized_question = re.sub("[^a-z0-9_]", "", question_with_underscores)
+        return self._normalized_question
+
+    def _get_agenda_column_names(self) -> Dict[str, Tuple[str, str, List[str]]]:
+        """
+        Returns the type, the name and the tokens of the name of each column that can be added to
+        the agenda.
+        """
+        if self._agenda_column_names is None:
+            self._agenda_column_names = {}
+            for column_name_with_type in self._column_productions_for_agenda:
+                column_type, column_name = column_name_with_type.split(":")
+                self._agenda_column_names[column_name_with_type] = (column_type, column_name,
+                                                                    column_name.split("_"))
+        return self._agenda_column_names
+
+    def _is_agenda_triggered(self,
+                             trigger: _AgendaTrigger,
+                             question_tokens: Set[str],
+                             question_phrases: Set[str],
+                             conservative: bool) -> bool:
+        if trigger.needs_number_columns and not self._table_has_number_columns:
+            return False
+        if trigger.needs_date_columns and not self._table_has_date_columns:
+            return False
+        if not (trigger.tokens & question_tokens or trigger.phrases & question_phrases or
+                (not conservative and trigger.liberal_tokens & question_tokens)):
+            return False
+        return (trigger.required_tokens <= question_tokens and
+                not trigger.excluded_tokens & question_tokens and
+                not trigger.excluded_phrases & question_phrases)
 
     def execute(self, logical_form: str) -> Union[List[str], int]:
         return self._executor.execute(logical_form)
@@ -392,3 +837,123 @@ class WikiTablesVariableFreeWorld(World):
         representation of instances, and returns True iff the logical form executes to those values.
         """
         return self._executor.evaluate_logical_form(logical_form, target_list)
+
+    def evaluate_logical_forms(self, logical_forms: List[str], target_list: List[str]) -> List[bool]:
+        """
+        Batched version of ``evaluate_logical_form``, that shares the execution of common
+        sub-expressions across the logical forms. Returns one boolean per logical form.
+        """
+        return self._executor.evaluate_logical_forms(logical_forms, target_list)
+
+    def execute_action_sequence(self, action_sequence: List[str]) -> Union[List[str], int]:
+        """
+        Executes the logical form produced by an action sequence, without rendering it as a
+        string and parsing it back. The result is the same as that of
+        ``execute(get_logical_form(action_sequence))``.
+        """
+        return self._executor.execute_expression(self._get_expression_for_action_sequence(action_sequence))
+
+    def evaluate_action_sequence(self, action_sequence: List[str], target_list: List[str]) -> bool:
+        """
+        Same as ``evaluate_logical_form``, but takes the action sequence that produces the logical
+        form (see ``execute_action_sequence``).
+        """
+        return self._executor.evaluate_expression(self._get_expression_for_action_sequence(action_sequence),
+                                                  target_list)
+
+    def evaluate_action_sequences(self, action_sequences: List[List[str]], target_list: List[str]) -> List[bool]:
+        """
+        Batched version of ``evaluate_action_sequence``, that shares the execution of common
+        sub-expressions like ``evaluate_logical_forms``.
+        """
+        expressions = [self._get_expression_for_action_sequence(action_sequence)
+                       for action_sequence in action_sequences]
+        return self._executor.evaluate_expressions(expressions, target_list)
+
+
+class LazyWikiTablesVariableFreeWorld:
+    """
+    A light stand-in for a ``WikiTablesVariableFreeWorld``, that only keeps the table context (the
+    table, which is shared by all the questions about it, and the question tokens), and builds the
+    world when one of its methods is first called. It has the methods and attributes of the world
+    that the models use, which are passed on to that world; use ``get_world`` for anything else.
+    The worlds are kept in a bounded cache, so reading a whole dataset into memory does not keep a
+    world for every instance; a world dropped from the cache is built again if it is used later.
+    The cache does not keep the lazy worlds alive, and the world of a lazy world that is garbage
+    collected is dropped from it the next time a lazy world gets its world.
+
+    Parameters
+    ----------
+    table_context : ``TableQuestionContext``
+        Context associated with the world.
+    materialized_worlds : ``LruCache``, optional
+        The cache to keep the world in, which is usually shared by all the lazy worlds a dataset
+        reader makes. If not given, we use a cache of ``MAX_MATERIALIZED_WORLDS`` shared by all such
+        lazy worlds in the process.
+    """
+    __slots__ = ("table_context", "_materialized_worlds", "_key", "__weakref__")
+
+    def __init__(self,
+                 table_context: TableQuestionContext,
+                 materialized_worlds: LruCache[int, WikiTablesVariableFreeWorld] = None) -> None:
+        self.table_context = table_context
+        self._set_materialized_worlds(materialized_worlds)
+
+    def _set_materialized_worlds(self, materialized_worlds: LruCache[int, WikiTablesVariableFreeWorld]) -> None:
+        if materialized_worlds is None:
+            materialized_worlds = _MATERIALIZED_WORLDS
+        self._materialized_worlds = materialized_worlds
+        self._key = next(_LAZY_WORLD_KEYS)
+        # A finalizer runs even if this lazy world is collected as part of a reference cycle. It
+        # only records the key, because it can run in the middle of a change to the cache.
+        finalizer = weakref.finalize(self, _COLLECTED_LAZY_WORLDS.append, (materialized_worlds, self._key))
+        finalizer.atexit = False
+
+    def get_world(self) -> WikiTablesVariableFreeWorld:
+        """
+        Returns the world for the table context, building it if it is not in the cache.
+        """
+        while _COLLECTED_LAZY_WORLDS:
+            materialized_worlds, key = _COLLECTED_LAZY_WORLDS.pop()
+            materialized_worlds.discard(key)
+        return self._materialized_worlds.get_or_add(self._key, self._build_world)
+
+    def _build_world(self) -> WikiTablesVariableFreeWorld:
+        return WikiTablesVariableFreeWorld(self.table_context)
+
+    @property
+    def table_graph(self) -> KnowledgeGraph:
+        return self.get_world().table_graph
+
+    @property
+    def terminal_productions(self) -> Dict[str, str]:
+        return self.get_world().terminal_productions
+
+    def get_valid_actions(self) -> Dict[str, List[str]]:
+        return self.get_world().get_valid_actions()
+
+    def all_possible_actions(self) -> List[str]:
+        return self.get_world().all_possible_actions()
+
+    def get_agenda(self, conservative: bool = False) -> List[str]:
+        return self.get_world().get_agenda(conservative)
+
+    def get_logical_form(self, action_sequence: List[str], add_var_function: bool = True) -> str:
+        return self.get_world().get_logical_form(action_sequence, add_var_function)
+
+    def evaluate_logical_form(self, logical_form: str, target_list: List[str]) -> bool:
+        return self.get_world().evaluate_logical_form(logical_form, target_list)
+
+    def evaluate_action_sequence(self, action_sequence: List[str], target_list: List[str]) -> bool:
+        return self.get_world().evaluate_action_sequence(action_sequence, target_list)
+
+    def __getstate__(self):
+        # Lazy worlds are pickled like worlds, and do not build their worlds when unpickled.
+        return _get_table_context_state(self.table_context)
+
+    def __setstate__(self, state) -> None:
+        self.table_context = _get_table_context_from_state(state)
+        self._set_materialized_worlds(None)
+
+    def __repr__(self):
+        return f"LazyWikiTablesVariableFreeWorld({self.table_context.table_id})"